@@ -1,22 +1,36 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import _thread
 import argparse
-import configparser
+import fnmatch
+import hashlib
 import json
 import os
 import re
-import shlex
-import subprocess
 import sys
-import xml.etree.ElementTree as ET
+import time
+from collections import OrderedDict, deque
 from pathlib import Path
 
+# XML, subprocess, configparser, threading and registry modules are imported by the code paths that
+# need them, so --show-config and an up-to-date regeneration start without loading them.
+# benchmarks/check_startup.py guards this.
+
 IS_WINDOWS = sys.platform == "win32"
 TOOL_NAME = "KeilFormat"
-
-if IS_WINDOWS:
-    import winreg
+TOOL_VERSION = "1.1.0"
+MAKEFILE_NAMES = ("Makefile", "makefile")
+# Build output, VCS metadata and web tooling never contain project files but can hold most of a tree.
+DEFAULT_IGNORE_DIRS = frozenset({
+    ".git", ".svn", ".hg", "node_modules", "__pycache__",
+    "objects", "listings", "build", "debug", "release",
+})
+# Per-project generated state (per-target databases, caches) lives under this directory.
+STATE_DIR_NAME = ".keil2json"
+# .uvprojx files at or above this size are read with the streaming reader instead of a full tree. The
+# .ewp streaming reader saves memory but is slower than the tree, so .ewp only streams with --stream.
+STREAM_THRESHOLD = 8 * 1024 * 1024
 
 
 def config_dir():
@@ -29,6 +43,99 @@ def config_path():
     return config_dir() / "config.json"
 
 
+def toolchain_index_path():
+    return config_dir() / "toolchains.json"
+
+
+class TimedPhase:
+    __slots__ = ("timings", "name", "start")
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timings.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class RunTimings:
+    # Phase timers and counters reported by --timings. Phases may nest (subprocess runs inside make), and
+    # a phase entered on several threads at once sums their wall times. Updates take a lock: make capture
+    # records from worker threads. (_thread is always loaded; threading is only imported by those modes.)
+    def __init__(self):
+        self.lock = _thread.allocate_lock()
+        self.reset()
+
+    def reset(self):
+        self.phases = OrderedDict()
+        self.counters = OrderedDict()
+        self.start = time.perf_counter()
+
+    def phase(self, name):
+        return TimedPhase(self, name)
+
+    def add(self, name, elapsed, calls=1):
+        with self.lock:
+            entry = self.phases.setdefault(name, [0.0, 0])
+            entry[0] += elapsed
+            entry[1] += calls
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        return {"phases": {name: list(entry) for name, entry in self.phases.items()}, "counters": dict(self.counters)}
+
+    def since(self, snapshot):
+        # What was recorded after snapshot(); a --workspace worker process hands this back to the parent.
+        phases = {}
+        for name, (elapsed, calls) in self.phases.items():
+            before = snapshot["phases"].get(name, [0.0, 0])
+            if calls != before[1]:
+                phases[name] = [elapsed - before[0], calls - before[1]]
+        counters = {}
+        for name, value in self.counters.items():
+            if value != snapshot["counters"].get(name, 0):
+                counters[name] = value - snapshot["counters"].get(name, 0)
+        return {"phases": phases, "counters": counters}
+
+    def merge(self, data):
+        for name, (elapsed, calls) in data["phases"].items():
+            self.add(name, elapsed, calls)
+        for name, value in data["counters"].items():
+            self.count(name, value)
+
+    def as_dict(self):
+        return {
+            "total_ms": round((time.perf_counter() - self.start) * 1000, 3),
+            "phases": {name: {"calls": calls, "ms": round(elapsed * 1000, 3)}
+                       for name, (elapsed, calls) in self.phases.items()},
+            "counters": dict(self.counters),
+        }
+
+    def table(self):
+        data = self.as_dict()
+        lines = [f"{'phase':24s} {'calls':>7s} {'total ms':>11s}"]
+        for name, phase in data["phases"].items():
+            lines.append(f"{name:24s} {phase['calls']:7d} {phase['ms']:11.1f}")
+        lines.append(f"{'total':24s} {'':7s} {data['total_ms']:11.1f}")
+        if data["counters"]:
+            lines.append("")
+            lines.append(f"{'counter':24s} {'value':>19s}")
+            for name, value in data["counters"].items():
+                lines.append(f"{name:24s} {value:19d}")
+        return "\n".join(lines)
+
+
+TIMINGS = RunTimings()
+
+
 class ConfigManager:
     DEFAULT_CONFIG = {
         "version": 1,
@@ -43,11 +150,29 @@ class ConfigManager:
             "cmsis_path": "",
             "c_include": "",
         },
+        "discovery": {
+            "max_depth": 8,
+            "ignore": [],
+        },
+        "clangd": {
+            "vendor_dirs": [],
+        },
     }
 
     def __init__(self):
         self.path = config_path()
-        self.config = self.load()
+        self._config = None
+
+    @property
+    def config(self):
+        # Read on first use: modes that never touch the config do not pay for loading it.
+        if self._config is None:
+            self._config = self.load()
+        return self._config
+
+    @config.setter
+    def config(self, value):
+        self._config = value
 
     def exists(self):
         return self.path.exists()
@@ -81,6 +206,7 @@ class ConfigManager:
 class RegistryScanner:
     @staticmethod
     def read_value(root, subkey, value_name, access):
+        import winreg
         try:
             with winreg.OpenKey(root, subkey, 0, access) as key:
                 value, _ = winreg.QueryValueEx(key, value_name)
@@ -90,6 +216,7 @@ class RegistryScanner:
 
     @staticmethod
     def enum_subkeys(root, subkey, access):
+        import winreg
         try:
             with winreg.OpenKey(root, subkey, 0, access) as key:
                 index = 0
@@ -104,6 +231,7 @@ class RegistryScanner:
 
     @staticmethod
     def registry_views():
+        import winreg
         views = [winreg.KEY_READ]
         if hasattr(winreg, "KEY_WOW64_32KEY"):
             views.append(winreg.KEY_READ | winreg.KEY_WOW64_32KEY)
@@ -115,6 +243,7 @@ class RegistryScanner:
     def find_keil(cls):
         if not IS_WINDOWS:
             return []
+        import winreg
         found = set()
         roots = [winreg.HKEY_LOCAL_MACHINE, winreg.HKEY_CURRENT_USER]
         for root in roots:
@@ -140,6 +269,7 @@ class RegistryScanner:
     def find_iar(cls):
         if not IS_WINDOWS:
             return []
+        import winreg
         found = set()
         roots = [winreg.HKEY_LOCAL_MACHINE, winreg.HKEY_CURRENT_USER]
         for root in roots:
@@ -228,6 +358,8 @@ def parse_tools_ini(keil_path):
     if not tools_ini.exists():
         return "", "", ""
 
+    import configparser
+
     parser = configparser.ConfigParser()
     try:
         parser.read(tools_ini, encoding="utf-8")
@@ -270,14 +402,15 @@ def parse_tools_ini(keil_path):
 
 
 def keil_pack_cmsis_base(install_path):
-    for base in keil_cmsis_bases(install_path):
-        return base
+    for base in ToolchainIndex.shared().lookup("keil", install_path)["cmsis_bases"]:
+        return Path(base)
     return None
 
 
-def keil_cmsis_bases(install_path):
+def keil_cmsis_bases(install_path, rte_path=None):
     root = Path(normalize_install_path(install_path, "keil") or install_path)
-    _, _, rte_path = parse_tools_ini(root)
+    if rte_path is None:
+        _, _, rte_path = parse_tools_ini(root)
     candidates = []
     if rte_path:
         candidates.extend(keil_cmsis_base_candidates(rte_path))
@@ -340,20 +473,18 @@ def keil_cmsis_base_candidates(rte_path):
 def cmsis_base(install_path, tool):
     root = Path(normalize_install_path(install_path, tool) or install_path)
     if tool == "keil":
-        bases = keil_cmsis_bases(root)
+        bases = ToolchainIndex.shared().lookup("keil", root)["cmsis_bases"]
         if bases:
-            return bases[0]
+            return Path(bases[0])
         return ide_subdir_or_root(root, "ARM") / "CMSIS"
     return ide_subdir_or_root(root, "arm") / "CMSIS"
 
 
 def find_cmsis_versions(install_path, tool):
-    if tool == "keil":
-        bases = keil_cmsis_bases(install_path)
-    else:
-        base = cmsis_base(install_path, tool)
-        bases = [base] if base.is_dir() else []
+    return ToolchainIndex.shared().lookup(tool, install_path)["cmsis_versions"]
+
 
+def scan_cmsis_versions(bases):
     versions = {}
     for base in bases:
         direct_candidates = [
@@ -388,6 +519,150 @@ def find_iar_c_include(iar_path):
     return str(include.resolve()) if include.is_dir() else ""
 
 
+def scan_keil_toolchain(install_path):
+    # One full scan of a Keil install: TOOLS.INI, every CMSIS base and its versions. Returns the record
+    # and the paths whose mtimes decide when the record goes stale.
+    root = Path(normalize_install_path(install_path, "keil") or install_path)
+    armcc_include, armclang_include, rte_path = parse_tools_ini(root)
+    bases = keil_cmsis_bases(root, rte_path)
+    arm_root = ide_subdir_or_root(root, "ARM")
+    watch = [root / "TOOLS.INI", arm_root / "Packs", arm_root / "PACK"]
+    if rte_path:
+        watch.append(Path(rte_path))
+    for base in bases:
+        watch.extend([base, base.parent])
+    record = {
+        "armcc_include": armcc_include,
+        "armclang_include": armclang_include,
+        "rte_path": rte_path,
+        "cmsis_bases": [str(base) for base in bases],
+        "cmsis_versions": scan_cmsis_versions(bases),
+    }
+    return record, watch
+
+
+def scan_iar_toolchain(install_path):
+    root = Path(normalize_install_path(install_path, "iar") or install_path)
+    arm_root = ide_subdir_or_root(root, "arm")
+    base = arm_root / "CMSIS"
+    bases = [base] if base.is_dir() else []
+    record = {
+        "c_include": find_iar_c_include(root),
+        "cmsis_bases": [str(base) for base in bases],
+        "cmsis_versions": scan_cmsis_versions(bases),
+    }
+    return record, [arm_root, base, arm_root / "inc" / "c"]
+
+
+def path_mtime(path):
+    try:
+        return Path(path).stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+class ToolchainIndex:
+    # Toolchain discovery persisted next to config.json, one record per tool and install path.
+    # A record stays valid while TOOLS.INI and the pack/CMSIS directories keep their mtimes, so a lookup
+    # costs a handful of stat() calls; installing or removing a pack moves a directory mtime and rescans.
+    VERSION = 1
+    _shared = None
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else toolchain_index_path()
+        self.data = self.load()
+        self.scans = 0
+
+    @classmethod
+    def shared(cls):
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    def load(self):
+        try:
+            with self.path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = None
+        if not isinstance(data, dict) or data.get("version") != self.VERSION:
+            return {"version": self.VERSION}
+        return data
+
+    @staticmethod
+    def is_valid(record):
+        stamp = record.get("stamp")
+        if not isinstance(stamp, dict):
+            return False
+        return all(path_mtime(path) == mtime for path, mtime in stamp.items())
+
+    def lookup(self, tool, install_path):
+        key = path_dedupe_key(normalize_install_path(install_path, tool) or install_path)
+        records = self.data.setdefault(tool, {})
+        record = records.get(key)
+        if record is not None and self.is_valid(record):
+            return record
+
+        scan = scan_keil_toolchain if tool == "keil" else scan_iar_toolchain
+        record, watch = scan(install_path)
+        record["stamp"] = {str(path): path_mtime(path) for path in watch}
+        records[key] = record
+        self.scans += 1
+        self.save()
+        return record
+
+    def save(self):
+        # Only a cache: a read-only config directory just means rescanning next time.
+        temp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with temp.open("w", encoding="utf-8") as f:
+                json.dump(self.data, f, indent=4, ensure_ascii=False)
+            os.replace(temp, self.path)
+        except OSError:
+            if temp.exists():
+                temp.unlink()
+
+
+def version_key(value):
+    return [int(part) if part.isdigit() else part for part in re.split(r"[.\-+]", value)]
+
+
+def split_pack_id(pack_id):
+    # "Keil.STM32F4xx_DFP.2.17.1" -> ("Keil", "STM32F4xx_DFP", "2.17.1")
+    parts = str(pack_id).strip().split(".", 2)
+    if len(parts) < 2:
+        return None
+    return parts[0], parts[1], parts[2] if len(parts) > 2 else ""
+
+
+def keil_pack_roots(install_path):
+    record = ToolchainIndex.shared().lookup("keil", install_path)
+    root = Path(normalize_install_path(install_path, "keil") or install_path)
+    arm_root = ide_subdir_or_root(root, "ARM")
+    roots = []
+    if record.get("rte_path"):
+        rte = Path(record["rte_path"])
+        roots.append(rte / "Packs" if rte.name.lower() == "arm" else rte)
+    roots.extend([arm_root / "Packs", arm_root / "PACK"])
+    return roots
+
+
+def find_pack_dir(pack_roots, vendor, name, version=""):
+    # The exact installed version, or the newest installed one when the project's version is missing.
+    for root in pack_roots:
+        pack = Path(root) / vendor / name
+        if version and (pack / version).is_dir():
+            return pack / version
+    for root in pack_roots:
+        pack = Path(root) / vendor / name
+        if pack.is_dir():
+            versions = [child for child in pack.iterdir() if child.is_dir()]
+            if versions:
+                return max(versions, key=lambda child: version_key(child.name))
+    return None
+
+
 def find_uv4_executable(config_manager=None, override=None):
     candidates = []
     if override:
@@ -423,14 +698,252 @@ def find_uv4_executable(config_manager=None, override=None):
     return ""
 
 
+def pdsc_tag(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def parse_pdsc(path):
+    # One iterparse pass over a .pdsc: the include dirs and defines of every device and variant, inherited
+    # from its family and subFamily, and the include dirs of every component. Paths stay pack relative.
+    import xml.etree.ElementTree as ET
+
+    scopes = []
+    stack = []
+    devices = {}
+    components = []
+    bundle = {}
+    for event, elem in ET.iterparse(str(path), events=("start", "end")):
+        tag = pdsc_tag(elem.tag)
+        if event == "start":
+            if tag in {"family", "subFamily", "device", "variant"} and "devices" in stack:
+                scopes.append({"parent": stack[-1] if stack and isinstance(stack[-1], int) else None,
+                               "includes": [], "defines": [], "processor": {}})
+                name = elem.get({"device": "Dname", "variant": "Dvariant"}.get(tag, ""))
+                if name:
+                    devices[name] = len(scopes) - 1
+                stack.append(len(scopes) - 1)
+                continue
+            if tag == "bundle":
+                bundle = dict(elem.attrib)
+            elif stack and isinstance(stack[-1], int):
+                scope = scopes[stack[-1]]
+                if tag == "compile":
+                    if elem.get("header"):
+                        scope["includes"].append(os.path.dirname(elem.get("header").replace("\\", "/")))
+                    if elem.get("define"):
+                        scope["defines"].append(elem.get("define"))
+                elif tag == "processor":
+                    scope["processor"].update(elem.attrib)
+            stack.append(tag)
+            continue
+
+        stack.pop()
+        if tag == "component":
+            includes = []
+            for file_elem in elem.iter():
+                if pdsc_tag(file_elem.tag) != "file":
+                    continue
+                name = (file_elem.get("name") or "").replace("\\", "/")
+                if file_elem.get("category") == "include":
+                    includes.append(name.rstrip("/"))
+                elif file_elem.get("category") == "header":
+                    includes.append(os.path.dirname(name))
+            components.append({
+                "Cclass": elem.get("Cclass", bundle.get("Cclass", "")),
+                "Cgroup": elem.get("Cgroup", ""),
+                "Csub": elem.get("Csub", ""),
+                "Cvariant": elem.get("Cvariant", ""),
+                "includes": list(dict.fromkeys(includes)),
+            })
+            elem.clear()
+        elif tag == "bundle":
+            bundle = {}
+        elif tag in {"family", "devices", "components"}:
+            elem.clear()
+
+    resolved = {}
+    for name, index in devices.items():
+        chain = []
+        while index is not None:
+            chain.append(scopes[index])
+            index = scopes[index]["parent"]
+        entry = {"includes": [], "defines": [], "processor": {}}
+        for scope in reversed(chain):
+            entry["includes"].extend(value for value in scope["includes"] if value not in entry["includes"])
+            entry["defines"].extend(value for value in scope["defines"] if value not in entry["defines"])
+            entry["processor"].update(scope["processor"])
+        resolved[name] = entry
+    return {"devices": resolved, "components": components}
+
+
+class PackIndex:
+    # Parsed .pdsc of one installed pack version, cached as JSON under <config dir>/packs. The cache is
+    # keyed by the .pdsc mtime, so it is built once per pack version rather than once per run.
+    VERSION = 1
+    _loaded = {}
+
+    def __init__(self, pack_dir, data):
+        self.pack_dir = Path(pack_dir)
+        self.data = data
+
+    @classmethod
+    def open(cls, pack_dir):
+        pack_dir = Path(pack_dir)
+        pdsc = next(iter(sorted(pack_dir.glob("*.pdsc"))), None)
+        if pdsc is None:
+            return None
+        stamp = path_mtime(pdsc)
+        loaded = cls._loaded.get(str(pack_dir))
+        if loaded and loaded[0] == stamp:
+            return loaded[1]
+
+        cache_path = config_dir() / "packs" / f"{pack_dir.parent.parent.name}.{pack_dir.parent.name}.{pack_dir.name}.json"
+        data = None
+        try:
+            with cache_path.open("r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("version") == cls.VERSION and cached.get("pdsc") == str(pdsc) and cached.get("mtime") == stamp:
+                data = cached
+        except (OSError, ValueError, AttributeError):
+            pass
+        if data is None:
+            data = {"version": cls.VERSION, "pdsc": str(pdsc), "mtime": stamp}
+            data.update(parse_pdsc(pdsc))
+            try:
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                with cache_path.open("w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False)
+            except OSError:
+                pass
+        index = cls(pack_dir, data)
+        cls._loaded[str(pack_dir)] = (stamp, index)
+        return index
+
+    def device(self, name):
+        return self.data["devices"].get(name)
+
+    def component_includes(self, cclass, cgroup, csub="", cvariant=""):
+        includes = []
+        for component in self.data["components"]:
+            if (component["Cclass"], component["Cgroup"]) != (cclass, cgroup):
+                continue
+            if csub and component["Csub"] != csub or cvariant and component["Cvariant"] != cvariant:
+                continue
+            includes.extend(component["includes"])
+        return includes
+
+
+def project_file_rank(name):
+    lower = name.lower()
+    if lower.endswith(".uvprojx"):
+        return 0
+    if lower.endswith(".ewp"):
+        return 1
+    if name in MAKEFILE_NAMES:
+        return 2
+    return None
+
+
+def is_ignored_dir(name, rel_path, patterns, names=DEFAULT_IGNORE_DIRS):
+    if name.lower() in names:
+        return True
+    for pattern in patterns:
+        if fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(rel_path, pattern):
+            return True
+    return False
+
+
+def walk_directories(root, max_depth=None, ignore=(), ignored_names=DEFAULT_IGNORE_DIRS):
+    # Breadth-first os.scandir walk yielding (directory, file names) for every directory that is not
+    # pruned; directories of one level come in name order.
+    root = str(root)
+    patterns = [p.replace("\\", "/").rstrip("/") for p in ignore or () if p]
+    queue = deque([(root, "", 0)])
+    while queue:
+        directory, rel_dir, depth = queue.popleft()
+        files = []
+        subdirs = []
+        walked = 0
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    walked += 1
+                    name = entry.name
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if is_dir:
+                        if max_depth is not None and depth >= max_depth:
+                            continue
+                        rel_path = f"{rel_dir}/{name}" if rel_dir else name
+                        if not is_ignored_dir(name, rel_path, patterns, ignored_names):
+                            subdirs.append((name, entry.path, rel_path))
+                        continue
+                    files.append(name)
+        except OSError:
+            continue
+        finally:
+            TIMINGS.count("dirs walked")
+            TIMINGS.count("entries walked", walked)
+        for _, path, rel_path in sorted(subdirs):
+            queue.append((path, rel_path, depth + 1))
+        yield directory, files
+
+
+def walk_project_files(root, max_depth=None, ignore=()):
+    # .uvprojx, .ewp and Makefile candidates in one pass. Shallow projects come first; inside one
+    # directory Keil wins over IAR, IAR over Makefile.
+    for directory, names in walk_directories(root, max_depth, ignore):
+        found = []
+        for name in names:
+            rank = project_file_rank(name)
+            if rank is not None:
+                found.append((rank, name))
+        for _, name in sorted(found):
+            yield Path(os.path.join(directory, name))
+
+
+def find_workspace_projects(root, max_depth=None, ignore=()):
+    # Every Keil/IAR project under root, plus each Makefile whose directory holds no Keil/IAR project and
+    # is not below an already selected Makefile (the parent make recurses into it). Breadth-first order.
+    projects = []
+    project_dirs = set()
+    make_dirs = []
+    for candidate in walk_project_files(root, max_depth, ignore):
+        parent = candidate.parent
+        if candidate.name in MAKEFILE_NAMES:
+            if parent in project_dirs or any(parent == d or d in parent.parents for d in make_dirs):
+                continue
+            make_dirs.append(parent)
+        else:
+            project_dirs.add(parent)
+        projects.append(candidate)
+    return projects
+
+
+def workspace_project_entries(project_file, options):
+    # Runs in a worker process: a fresh generator for one workspace project. Errors are returned, not
+    # raised, so one broken project does not abort the others.
+    start = time.perf_counter()
+    before = TIMINGS.snapshot()
+    generator = None
+    try:
+        generator = CompileCommandsGenerator(path=project_file, **options)
+        with TIMINGS.phase("discover"):
+            generator.detect_project()
+        entries = generator.project_entries(Path(project_file))
+        error = ""
+    except (OSError, RuntimeError, ValueError, SyntaxError) as exc:
+        entries = []
+        error = str(exc)
+    if generator is not None:
+        generator.record_path_counters()
+    return entries, time.perf_counter() - start, error, TIMINGS.since(before)
+
+
 def parse_keil_targets(project_file):
-    tree = ET.parse(project_file)
-    root = tree.getroot()
-    targets = []
-    for elem in root.findall(".//Target/TargetName"):
-        if elem.text and elem.text.strip():
-            targets.append(elem.text.strip())
-    return targets
+    return ProjectDocument.open(project_file).targets()
 
 
 def build_keil_uv4_command(uv4, project_file, output, action, target=None, jobs=None, show_window=False):
@@ -463,16 +976,15 @@ def build_keil_uv4_command(uv4, project_file, output, action, target=None, jobs=
 
 
 def run_keil_uv4(project_path, action, target=None, jobs=None, show_window=False,
-                uv4_path=None, log_path=None, config_manager=None, list_targets=False):
-    if not IS_WINDOWS:
-        raise RuntimeError("Keil UV4 command execution is only supported on Windows.")
-
+                uv4_path=None, log_path=None, config_manager=None, list_targets=False, verbose=False):
     detector = CompileCommandsGenerator(path=project_path, config_manager=config_manager)
-    project_file = detector.detect_project()
+    with TIMINGS.phase("discover"):
+        project_file = detector.detect_project()
     if project_file.suffix.lower() != ".uvprojx":
         raise RuntimeError(f"Keil UV4 requires a .uvprojx project, got: {project_file}")
 
-    targets = parse_keil_targets(project_file)
+    with TIMINGS.phase("read project"):
+        targets = parse_keil_targets(project_file)
     if list_targets:
         print(f"Project: {project_file}")
         if targets:
@@ -481,8 +993,15 @@ def run_keil_uv4(project_path, action, target=None, jobs=None, show_window=False
                 print(f"  {item}")
         else:
             print("No TargetName found.")
+        if verbose:
+            print(f"XML parses: {ProjectDocument.parse_count}")
         return 0
 
+    # Listing targets only reads the project; running UV4 needs Windows.
+    if not IS_WINDOWS:
+        raise RuntimeError("Keil UV4 command execution is only supported on Windows.")
+    import subprocess
+
     if target and targets and target not in targets:
         print(f"Warning: target '{target}' was not found in project target list.")
         print("Available targets:")
@@ -509,12 +1028,14 @@ def run_keil_uv4(project_path, action, target=None, jobs=None, show_window=False
     if IS_WINDOWS and not show_window and action != "debug":
         creationflags = getattr(subprocess, "CREATE_NO_WINDOW", 0)
 
-    result = subprocess.run(
-        command,
-        cwd=str(detector.project_root),
-        creationflags=creationflags,
-        check=False,
-    )
+    TIMINGS.count("subprocesses")
+    with TIMINGS.phase("subprocess"):
+        result = subprocess.run(
+            command,
+            cwd=str(detector.project_root),
+            creationflags=creationflags,
+            check=False,
+        )
 
     if output.exists():
         try:
@@ -528,21 +1049,16 @@ def run_keil_uv4(project_path, action, target=None, jobs=None, show_window=False
     return result.returncode
 
 
-def detect_keil_compiler_type(project_file):
-    tree = ET.parse(project_file)
-    root = tree.getroot()
-
-    uac6 = root.find(".//uAC6")
-    if uac6 is not None and uac6.text:
+def keil_compiler_type(uac6_text, pcc_text):
+    if uac6_text:
         try:
-            if int(uac6.text.strip()) > 0:
+            if int(uac6_text.strip()) > 0:
                 return "armclang"
         except ValueError:
             pass
 
-    pcc = root.find(".//pCCUsed")
-    if pcc is not None and pcc.text:
-        text = pcc.text.lower()
+    if pcc_text:
+        text = pcc_text.lower()
         if "armclang" in text or "ac6" in text:
             return "armclang"
         if "armcc" in text:
@@ -551,6 +1067,574 @@ def detect_keil_compiler_type(project_file):
     return "armcc"
 
 
+def keil_compiler_version(pcc_text):
+    # pCCUsed reads like "5060960::V5.06 update 7 (build 960)::.\ARMCC"; the leading number is __ARMCC_VERSION.
+    match = re.match(r"\s*(\d+)::", pcc_text or "")
+    return int(match.group(1)) if match else None
+
+
+# Per-toolchain settings for clangd: the driver written to compile_commands.json and the macros the real
+# compiler predefines. Keil and IAR compilers cannot be run by clangd, so their entries use clang with an
+# ARM target; the keyword stubs keep vendor extensions in CMSIS/HAL headers from turning into errors.
+TOOLCHAIN_PROFILES = {
+    "armcc": {
+        "compiler": "clang",
+        "target": "arm-none-eabi",
+        "version": 5060960,
+        "defines": ("__CC_ARM", "__ARMCC_VERSION={version}", "__NO_EMBEDDED_ASM",
+                    "__packed=__attribute__((packed))", "__weak=__attribute__((weak))", "__irq=", "__value_in_regs="),
+    },
+    "armclang": {
+        "compiler": "clang",
+        "target": "arm-none-eabi",
+        "version": 6190004,
+        "defines": ("__ARMCC_VERSION={version}", "__ARMCOMPILER_VERSION={version}"),
+    },
+    "iar": {
+        "compiler": "clang",
+        "target": "arm-none-eabi",
+        "version": 8,
+        "defines": ("__ICCARM__=1", "__IAR_SYSTEMS_ICC__={version}", "__no_init=", "__root=", "__ramfunc=",
+                    "__task=", "__weak=__attribute__((weak))"),
+    },
+    "gcc": {
+        "compiler": "arm-none-eabi-gcc",
+        "target": "",
+        "version": None,
+        "defines": ("__GNUC__",),
+    },
+}
+KEIL_CPU_TYPE_RE = re.compile(r'CPUTYPE\("([^"]+)"\)')
+# Keil CPUTYPE names clang does not spell the same way; SecurCore parts build as their Cortex-M base and
+# the generic Armv8-M types have no -mcpu, only an architecture. Names not listed get no CPU flags.
+KEIL_CPU_ARGS = {
+    "CORTEX-M0": ("-mcpu=cortex-m0",),
+    "CORTEX-M0+": ("-mcpu=cortex-m0plus",),
+    "CORTEX-M1": ("-mcpu=cortex-m1",),
+    "CORTEX-M3": ("-mcpu=cortex-m3",),
+    "CORTEX-M4": ("-mcpu=cortex-m4",),
+    "CORTEX-M7": ("-mcpu=cortex-m7",),
+    "CORTEX-M23": ("-mcpu=cortex-m23",),
+    "CORTEX-M33": ("-mcpu=cortex-m33",),
+    "CORTEX-M35P": ("-mcpu=cortex-m35p",),
+    "CORTEX-M55": ("-mcpu=cortex-m55",),
+    "CORTEX-M85": ("-mcpu=cortex-m85",),
+    "SC000": ("-mcpu=cortex-m0",),
+    "SC300": ("-mcpu=cortex-m3",),
+    "ARMV8MBL": ("-march=armv8-m.base",),
+    "ARMV8MML": ("-march=armv8-m.main",),
+    "ARMV81MML": ("-march=armv8.1-m.main",),
+}
+KEIL_FPU_RE = re.compile(r"\bFPU(\d)(?:\((\w+)\))?")
+# Keil FPU2 is the Cortex-M4 FPv4-SP unit; FPU3 is FPv5, single (SFPU) or double (DFPU) precision.
+KEIL_FPU_NAMES = {("2", ""): "fpv4-sp-d16", ("3", "SFPU"): "fpv5-sp-d16", ("3", "DFPU"): "fpv5-d16", ("3", ""): "fpv5-d16"}
+
+
+def keil_cpu_args(cpu_text):
+    args = []
+    match = KEIL_CPU_TYPE_RE.search(cpu_text or "")
+    cpu_args = KEIL_CPU_ARGS.get(match.group(1).strip().upper()) if match else None
+    if not cpu_args:
+        return args
+    args.extend(cpu_args)
+    fpu = KEIL_FPU_RE.search(cpu_text)
+    fpu_name = KEIL_FPU_NAMES.get((fpu.group(1), (fpu.group(2) or "").upper())) if fpu else None
+    if fpu_name:
+        args.extend([f"-mfpu={fpu_name}", "-mfloat-abi=hard"])
+    else:
+        args.append("-mfloat-abi=soft")
+    if re.search(r"\bEBIG\b", cpu_text):
+        args.append("-mbig-endian")
+    elif re.search(r"\bELITTLE\b", cpu_text):
+        args.append("-mlittle-endian")
+    return args
+
+
+def toolchain_profile(compiler_type, version=None, cpu_text=""):
+    # (driver, flags) for one toolchain, compiler version and Keil Cpu string.
+    profile = TOOLCHAIN_PROFILES.get(compiler_type, TOOLCHAIN_PROFILES["gcc"])
+    version = version or profile["version"]
+    args = [f"--target={profile['target']}"] if profile["target"] else []
+    args.extend(keil_cpu_args(cpu_text))
+    args.extend(f"-D{value.format(version=version)}" for value in profile["defines"])
+    return profile["compiler"], args
+
+
+IAR_INCLUDE_OPTIONS_ORDER = ("CCIncludePath2", "CCIncludePath")
+IAR_DEFINE_OPTIONS_ORDER = ("CCDefines", "CCDefines2")
+IAR_INCLUDE_OPTIONS = set(IAR_INCLUDE_OPTIONS_ORDER)
+IAR_DEFINE_OPTIONS = set(IAR_DEFINE_OPTIONS_ORDER)
+KEIL_TARGET_CONTROLS = ("TargetArmAds", "Cads", "VariousControls")
+# <TargetOption><TargetCommonOption> fields naming the device, its pack and the CPU string.
+KEIL_DEVICE_FIELDS = ("Device", "Vendor", "PackID", "Cpu")
+KEIL_OPTION_CONTROLS = {
+    ("GroupOption", "GroupArmAds", "Cads", "VariousControls"),
+    ("FileOption", "FileArmAds", "Cads", "VariousControls"),
+}
+IAR_OPTION_PATH = ("configuration", "settings", "data", "option")
+
+
+class ProjectDocument:
+    # One parsed .uvprojx/.ewp tree shared by target listing, compiler detection and source parsing.
+    parse_count = 0
+    _cache = {}
+
+    def __init__(self, path, root):
+        self.path = Path(path)
+        self.root = root
+        self.kind = "keil" if self.path.suffix.lower() == ".uvprojx" else "iar"
+
+    @classmethod
+    def open(cls, project_file):
+        if isinstance(project_file, cls):
+            return project_file
+        path = Path(project_file).resolve()
+        stat = path.stat()
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = cls._cache.get(str(path))
+        if cached and cached[0] == stamp:
+            return cached[1]
+        import xml.etree.ElementTree as ET
+
+        document = cls(path, ET.parse(path).getroot())
+        cls.parse_count += 1
+        TIMINGS.count("xml parses")
+        cls._cache[str(path)] = (stamp, document)
+        return document
+
+    @staticmethod
+    def text(elem):
+        if elem is None or not elem.text:
+            return ""
+        return elem.text.strip()
+
+    def target_elements(self):
+        # Keil <Target> elements or IAR top-level <configuration> elements.
+        return self.root.findall(".//Target" if self.kind == "keil" else "configuration")
+
+    def targets(self):
+        tag = "TargetName" if self.kind == "keil" else "name"
+        names = [self.text(elem.find(tag)) for elem in self.target_elements()]
+        return [name for name in names if name]
+
+    def compiler_type(self, target):
+        if self.kind != "keil":
+            return "iar"
+        return keil_compiler_type(self.text(target.find(".//uAC6")), self.text(target.find(".//pCCUsed")))
+
+    def controls(self, target=None):
+        scope = self.root if target is None else target
+        return scope.find(".//TargetArmAds/Cads/VariousControls")
+
+    def groups(self, target=None):
+        scope = self.root if target is None else target
+        return scope.findall(".//Group" if self.kind == "keil" else ".//group")
+
+    def options(self, configuration=None):
+        if configuration is None:
+            options = self.root.findall(".//configuration/settings/data/option")
+        else:
+            options = configuration.findall("settings/data/option")
+        for option in options:
+            name = self.text(option.find("name"))
+            if name:
+                yield name, [s.text.strip() for s in option.findall("state") if s.text and s.text.strip()]
+
+    def files(self, target=None):
+        for group in self.groups(target):
+            if self.kind == "keil":
+                for file_elem in group.findall(".//File"):
+                    value = self.text(file_elem.find("FilePath"))
+                    if value:
+                        yield value
+            else:
+                for file_elem in group.findall("file"):
+                    value = self.text(file_elem.find("name"))
+                    if value:
+                        yield value
+
+    def iar_overrides(self, elem):
+        # Group- or file-level <configuration> overrides keyed by configuration name.
+        overrides = {}
+        for configuration in elem.findall("configuration"):
+            name = self.text(configuration.find("name"))
+            if name:
+                overrides[name] = dict(self.options(configuration))
+        return overrides
+
+    def iar_file_records(self):
+        # (raw path, [override dicts from the outermost group down to the file]) in files() order.
+        chains = {}
+
+        def walk(parent, chain):
+            for child in parent.findall("group"):
+                chains[child] = chain + [self.iar_overrides(child)]
+                walk(child, chains[child])
+
+        walk(self.root, [])
+        records = []
+        for group in self.groups():
+            chain = chains.get(group, [])
+            for file_elem in group.findall("file"):
+                value = self.text(file_elem.find("name"))
+                if value:
+                    records.append((value, chain + [self.iar_overrides(file_elem)]))
+        return records
+
+    def device(self, target):
+        common = target.find("TargetOption/TargetCommonOption")
+        if common is None:
+            return {}
+        fields = {name: self.text(common.find(name)) for name in KEIL_DEVICE_FIELDS}
+        return {name: value for name, value in fields.items() if value}
+
+    def rte_components(self):
+        components = []
+        for component in self.root.findall("RTE/components/component"):
+            package = component.find("package")
+            pack = package.attrib if package is not None else {}
+            components.append((
+                component.get("Cclass", ""), component.get("Cgroup", ""),
+                component.get("Csub", ""), component.get("Cvariant", ""),
+                (pack.get("vendor", ""), pack.get("name", ""), pack.get("version", "")),
+                tuple(info.get("name", "") for info in component.findall("targetInfos/targetInfo")),
+            ))
+        return components
+
+    def output_directory(self, name=None):
+        # Keil only: the Objects directory holding the target's .dep and .__i files.
+        for elem in self.target_elements():
+            if name is None or self.text(elem.find("TargetName")) == name:
+                return self.text(elem.find("TargetOption/TargetCommonOption/OutputDirectory"))
+        return ""
+
+    def keil_target_files(self, target, summary_target):
+        for group in self.groups(target):
+            group_controls = keil_controls_text(group.find("GroupOption/GroupArmAds/Cads/VariousControls"))
+            for file_elem in group.findall(".//File"):
+                value = self.text(file_elem.find("FilePath"))
+                if not value:
+                    continue
+                file_controls = keil_controls_text(file_elem.find("FileOption/FileArmAds/Cads/VariousControls"))
+                summary_target.add_keil_file(value, group_controls, file_controls)
+
+    def summary(self):
+        summary = ProjectSummary(self.kind)
+        records = None if self.kind == "keil" else self.iar_file_records()
+        for elem in self.target_elements():
+            target = TargetSummary(self.text(elem.find("TargetName" if self.kind == "keil" else "name")))
+            target.compiler_type = self.compiler_type(elem)
+            if self.kind == "keil":
+                controls = self.controls(elem)
+                if controls is not None:
+                    include_elem = controls.find("IncludePath")
+                    if include_elem is not None and include_elem.text:
+                        target.include_paths.extend(include_elem.text.split(";"))
+                    define_elem = controls.find("Define")
+                    if define_elem is not None and define_elem.text:
+                        target.defines.extend(define_elem.text.split(","))
+                self.keil_target_files(elem, target)
+                target.device = self.device(elem)
+                target.compiler_version = keil_compiler_version(self.text(elem.find(".//pCCUsed")))
+            else:
+                for option_name, values in self.options(elem):
+                    if option_name in IAR_INCLUDE_OPTIONS:
+                        target.include_paths.extend(values)
+                    elif option_name in IAR_DEFINE_OPTIONS:
+                        target.defines.extend(values)
+            summary.targets.append(target)
+        if not summary.targets:
+            target = TargetSummary("")
+            target.compiler_type = summary.default_compiler_type()
+            if self.kind == "keil":
+                self.keil_target_files(self.root, target)
+            summary.targets.append(target)
+        if records is not None:
+            summary.share_iar_files(records)
+        if self.kind == "keil":
+            summary.rte_components = self.rte_components()
+        return summary
+
+
+def keil_controls_text(controls):
+    if controls is None:
+        return None, None
+    include_elem = controls.find("IncludePath")
+    define_elem = controls.find("Define")
+    return (
+        include_elem.text if include_elem is not None else None,
+        define_elem.text if define_elem is not None else None,
+    )
+
+
+def split_keil_option(text, separator):
+    if not text or not text.strip():
+        return []
+    return text.split(separator)
+
+
+def iar_effective_options(include_paths, defines, overrides):
+    # IAR overrides replace the inherited option instead of extending it; the innermost override wins.
+    for options in overrides:
+        if not options:
+            continue
+        override_includes = [v for name in IAR_INCLUDE_OPTIONS_ORDER for v in options.get(name, [])]
+        override_defines = [v for name in IAR_DEFINE_OPTIONS_ORDER for v in options.get(name, [])]
+        if any(name in options for name in IAR_INCLUDE_OPTIONS):
+            include_paths = override_includes
+        if any(name in options for name in IAR_DEFINE_OPTIONS):
+            defines = override_defines
+    return include_paths, defines
+
+
+class TargetSummary:
+    # Raw, unresolved include paths, defines and source paths of one Keil target or IAR configuration.
+    # file_options holds the effective (include paths, defines) of sources whose group or file overrides them.
+    def __init__(self, name):
+        self.name = name
+        self.compiler_type = ""
+        self.compiler_version = None
+        self.include_paths = []
+        self.defines = []
+        self.files = []
+        self.file_options = {}
+        self.device = {}
+
+    def add_keil_file(self, value, group_controls, file_controls):
+        self.files.append(value)
+        extra_includes = split_keil_option(group_controls[0], ";") + split_keil_option(file_controls[0], ";")
+        extra_defines = split_keil_option(group_controls[1], ",") + split_keil_option(file_controls[1], ",")
+        if extra_includes or extra_defines:
+            self.file_options[value] = (self.include_paths + extra_includes, self.defines + extra_defines)
+
+    def as_tuple(self):
+        return (self.name, self.compiler_type, self.compiler_version, self.include_paths, self.defines, self.files,
+                self.file_options, self.device)
+
+
+class ProjectSummary:
+    def __init__(self, kind):
+        self.kind = kind
+        self.targets = []
+        # Keil RTE components: (Cclass, Cgroup, Csub, Cvariant, (pack vendor, name, version), target names).
+        self.rte_components = []
+
+    def default_compiler_type(self):
+        return "armcc" if self.kind == "keil" else "iar"
+
+    @property
+    def compiler_type(self):
+        return self.targets[0].compiler_type if self.targets else self.default_compiler_type()
+
+    def target(self, name):
+        for target in self.targets:
+            if target.name == name:
+                return target
+        return None
+
+    def target_components(self, target):
+        # An RTE component without <targetInfos> belongs to every target.
+        return [c for c in self.rte_components if not c[5] or target.name in c[5]]
+
+    def share_iar_files(self, records):
+        # IAR lists sources once for every configuration; only the overrides differ per configuration.
+        files = [value for value, _ in records]
+        for target in self.targets:
+            target.files = files
+            for value, chain in records:
+                overrides = [owner.get(target.name) for owner in chain]
+                if any(overrides):
+                    target.file_options[value] = iar_effective_options(target.include_paths, target.defines, overrides)
+
+    def as_tuple(self):
+        return self.kind, [target.as_tuple() for target in self.targets], self.rte_components
+
+    def __eq__(self, other):
+        return isinstance(other, ProjectSummary) and self.as_tuple() == other.as_tuple()
+
+
+class StreamingProjectReader:
+    # Single forward iterparse pass over a .uvprojx/.ewp. Every element is dropped from its parent once
+    # it ends, so memory stays bounded by nesting depth instead of file size. The result matches
+    # ProjectDocument.summary() for the same file.
+    def __init__(self, path):
+        self.path = Path(path)
+        self.kind = "keil" if self.path.suffix.lower() == ".uvprojx" else "iar"
+
+    @staticmethod
+    def is_override(tags):
+        # IAR group- or file-level <configuration>, as opposed to the top-level configurations.
+        owner = tags[-2] if len(tags) > 1 else ""
+        return owner == "group" or (owner == "file" and len(tags) > 2 and tags[-3] == "group")
+
+    def read(self):
+        import xml.etree.ElementTree as ET
+
+        summary = ProjectSummary(self.kind)
+        tags = []
+        elems = []
+        target = None
+        uac6 = pcc = None
+        include_text = define_text = None
+        controls_done = False
+        group_controls = file_controls = None
+        file_value = None
+        group_files = []
+        target_groups = []
+        option_name = None
+        option_values = []
+        override = None
+        owners = []
+        group_slots = []
+        group_stack = []
+        component = None
+
+        for event, elem in ET.iterparse(str(self.path), events=("start", "end")):
+            tag = elem.tag
+            if event == "start":
+                tags.append(tag)
+                elems.append(elem)
+                if self.kind == "keil":
+                    if tag == "Target":
+                        target = TargetSummary("")
+                        target_groups = []
+                        uac6 = pcc = include_text = define_text = None
+                        controls_done = False
+                    elif tag == "Group":
+                        group_controls = [None, None]
+                        group_files = []
+                    elif tag == "File":
+                        file_controls = [None, None]
+                        file_value = None
+                    elif tag == "component" and tuple(tags[-3:-1]) == ("RTE", "components"):
+                        component = [elem.get("Cclass", ""), elem.get("Cgroup", ""), elem.get("Csub", ""),
+                                     elem.get("Cvariant", ""), ("", "", ""), []]
+                    elif tag == "package" and component is not None and tags[-2] == "component":
+                        component[4] = (elem.get("vendor", ""), elem.get("name", ""), elem.get("version", ""))
+                    elif tag == "targetInfo" and component is not None and tags[-2] == "targetInfos":
+                        component[5].append(elem.get("name", ""))
+                elif len(tags) == 2 and tag == "configuration":
+                    target = TargetSummary("")
+                elif tag == "group":
+                    group_slots.append([])
+                    group_stack.append(len(group_slots) - 1)
+                    owners.append({})
+                elif tag == "file" and len(tags) > 1 and tags[-2] == "group":
+                    file_value = None
+                    owners.append({})
+                elif tag == "configuration" and self.is_override(tags):
+                    override = [None, {}]
+                elif tag == "option" and tuple(tags[-4:]) == IAR_OPTION_PATH:
+                    option_name = None
+                    option_values = []
+                continue
+
+            text = elem.text
+            if self.kind == "keil":
+                if tag == "component" and component is not None and tags[-2] == "components":
+                    component[5] = tuple(component[5])
+                    summary.rte_components.append(tuple(component))
+                    component = None
+                elif target is None:
+                    pass
+                elif tag == "TargetName" and tags[-2] == "Target":
+                    target.name = (text or "").strip()
+                elif tag == "uAC6" and uac6 is None:
+                    uac6 = text or ""
+                elif tag == "pCCUsed" and pcc is None:
+                    pcc = text or ""
+                elif tag in KEIL_DEVICE_FIELDS and tags[-2] == "TargetCommonOption" and tag not in target.device:
+                    if text and text.strip():
+                        target.device[tag] = text.strip()
+                elif tag == "VariousControls" and tuple(tags[-3:]) == KEIL_TARGET_CONTROLS:
+                    controls_done = True
+                elif not controls_done and tuple(tags[-4:-1]) == KEIL_TARGET_CONTROLS:
+                    if tag == "IncludePath" and include_text is None:
+                        include_text = text or ""
+                    elif tag == "Define" and define_text is None:
+                        define_text = text or ""
+                elif tag in {"IncludePath", "Define"} and tuple(tags[-5:-1]) in KEIL_OPTION_CONTROLS:
+                    controls = group_controls if tags[-5] == "GroupOption" else file_controls
+                    index = 0 if tag == "IncludePath" else 1
+                    if controls is not None and controls[index] is None:
+                        controls[index] = text or ""
+                elif tag == "FilePath" and tags[-2] == "File" and "Group" in tags:
+                    if text and text.strip():
+                        file_value = text.strip()
+                elif tag == "File" and "Group" in tags:
+                    if file_value:
+                        group_files.append((file_value, file_controls))
+                    file_controls = None
+                elif tag == "Group":
+                    target_groups.append((group_controls, group_files))
+                    group_controls = None
+                elif tag == "Target":
+                    target.compiler_type = keil_compiler_type(uac6, pcc)
+                    target.compiler_version = keil_compiler_version(pcc)
+                    if include_text:
+                        target.include_paths.extend(include_text.split(";"))
+                    if define_text:
+                        target.defines.extend(define_text.split(","))
+                    # Group and file options extend the target lists, so they are applied once those are complete.
+                    for controls, files in target_groups:
+                        for value, file_option in files:
+                            target.add_keil_file(value, controls, file_option)
+                    summary.targets.append(target)
+                    target = None
+            else:
+                if len(tags) == 3 and tag == "name" and tags[1] == "configuration":
+                    target.name = (text or "").strip()
+                elif tag in {"name", "state"} and tuple(tags[-5:-1]) == IAR_OPTION_PATH:
+                    if tag == "name" and text and text.strip():
+                        option_name = text.strip()
+                    elif tag == "state" and text and text.strip():
+                        option_values.append(text.strip())
+                elif tag == "option" and tuple(tags[-4:]) == IAR_OPTION_PATH:
+                    if len(tags) == 5:
+                        if option_name in IAR_INCLUDE_OPTIONS:
+                            target.include_paths.extend(option_values)
+                        elif option_name in IAR_DEFINE_OPTIONS:
+                            target.defines.extend(option_values)
+                    elif override is not None and option_name:
+                        override[1][option_name] = option_values
+                elif len(tags) == 2 and tag == "configuration":
+                    target.compiler_type = "iar"
+                    summary.targets.append(target)
+                    target = None
+                elif tag == "name" and tags[-2] == "configuration" and override is not None:
+                    override[0] = (text or "").strip()
+                elif tag == "configuration" and self.is_override(tags):
+                    if override is not None and override[0]:
+                        owners[-1][override[0]] = override[1]
+                    override = None
+                elif tag == "name" and tuple(tags[-3:-1]) == ("group", "file"):
+                    if text and text.strip():
+                        file_value = text.strip()
+                elif tag == "file" and len(tags) > 1 and tags[-2] == "group":
+                    file_owner = owners.pop()
+                    if file_value:
+                        group_slots[group_stack[-1]].append((file_value, list(owners) + [file_owner]))
+                elif tag == "group":
+                    group_stack.pop()
+                    owners.pop()
+
+            tags.pop()
+            elems.pop()
+            elem.clear()
+            if elems:
+                elems[-1].remove(elem)
+
+        ProjectDocument.parse_count += 1
+        TIMINGS.count("xml parses")
+        if not summary.targets:
+            target = TargetSummary("")
+            target.compiler_type = summary.default_compiler_type()
+            summary.targets.append(target)
+        if self.kind == "iar":
+            summary.share_iar_files([record for slot in group_slots for record in slot])
+        return summary
+
+
 def prompt_path(message):
     try:
         value = input(message).strip().strip('"')
@@ -619,7 +1703,8 @@ def first_run_setup(config_manager):
     if keil_path:
         config["keil"]["install_path"] = keil_path
         config["keil"]["cmsis_path"] = choose_cmsis("keil", keil_path)
-        armcc_include, armclang_include, _ = parse_tools_ini(keil_path)
+        toolchain = ToolchainIndex.shared().lookup("keil", keil_path)
+        armcc_include, armclang_include = toolchain["armcc_include"], toolchain["armclang_include"]
         config["keil"]["armcc_include"] = armcc_include
         config["keil"]["armclang_include"] = armclang_include
         if not armcc_include and not armclang_include:
@@ -641,7 +1726,7 @@ def first_run_setup(config_manager):
     if iar_path:
         config["iar"]["install_path"] = iar_path
         config["iar"]["cmsis_path"] = choose_cmsis("iar", iar_path)
-        config["iar"]["c_include"] = find_iar_c_include(iar_path)
+        config["iar"]["c_include"] = ToolchainIndex.shared().lookup("iar", iar_path)["c_include"]
         if not config["iar"]["c_include"]:
             print("IAR C include path was not found at arm/inc/c.")
             config["iar"]["c_include"] = prompt_path("Enter IAR C include path (Enter to skip): ")
@@ -654,15 +1739,810 @@ def first_run_setup(config_manager):
     print(f"Configuration saved: {config_manager.path}")
 
 
+class PathNormalizer:
+    # Per-run memo of Path.resolve(). A path is split into parent directory and name; each distinct parent
+    # is resolved once and only symlinked leaves cost another lookup. Both caches are LRU bounded.
+    def __init__(self, max_entries=65536):
+        self.max_entries = max_entries
+        self.paths = OrderedDict()
+        self.dirs = OrderedDict()
+        self.formatted = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.dir_misses = 0
+
+    def remember(self, cache, key, value):
+        cache[key] = value
+        if len(cache) > self.max_entries:
+            cache.popitem(last=False)
+        return value
+
+    def resolve_dir(self, value):
+        cached = self.dirs.get(value)
+        if cached is not None:
+            self.dirs.move_to_end(value)
+            return cached
+        self.dir_misses += 1
+        return self.remember(self.dirs, value, os.path.realpath(value))
+
+    def resolve(self, value):
+        key = os.fspath(value)
+        cached = self.paths.get(key)
+        if cached is not None:
+            self.hits += 1
+            self.paths.move_to_end(key)
+            return cached
+        self.misses += 1
+        parent, name = os.path.split(key)
+        if not parent or name in {"", ".", ".."}:
+            resolved = self.resolve_dir(key)
+        else:
+            resolved = os.path.join(self.resolve_dir(parent), name)
+            if os.path.islink(resolved):
+                resolved = os.path.realpath(resolved)
+        return self.remember(self.paths, key, resolved)
+
+    def format(self, value, root, absolute):
+        key = (os.fspath(value), root, absolute)
+        cached = self.formatted.get(key)
+        if cached is not None:
+            self.hits += 1
+            self.formatted.move_to_end(key)
+            return cached
+        path = self.resolve(value)
+        if absolute:
+            result = path.replace("\\", "/")
+        else:
+            try:
+                result = os.path.relpath(path, root).replace("\\", "/")
+            except ValueError:
+                result = path.replace("\\", "/")
+        return self.remember(self.formatted, key, result)
+
+    def add_counts(self, other):
+        self.hits += other.hits
+        self.misses += other.misses
+        self.dir_misses += other.dir_misses
+
+    def summary(self):
+        return f"Path cache: {self.hits} hits, {self.misses} misses, {self.dir_misses} directories resolved"
+
+
+def file_fingerprint(path, previous=None):
+    try:
+        stat = Path(path).stat()
+    except OSError:
+        return None
+    record = {"mtime": stat.st_mtime_ns, "size": stat.st_size}
+    if previous and previous.get("mtime") == record["mtime"] and previous.get("size") == record["size"]:
+        record["sha1"] = previous.get("sha1", "")
+        return record
+    digest = hashlib.sha1()
+    try:
+        with Path(path).open("rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    record["sha1"] = digest.hexdigest()
+    return record
+
+
+def fingerprint_key(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    # Fingerprints of everything a Keil/IAR generation depends on, plus the entries it produced.
+    # A stat() per input decides freshness; content hashes are only recomputed when mtime or size moved.
+    def __init__(self, path):
+        self.path = Path(path)
+        self.data = self.load()
+
+    def load(self):
+        try:
+            with self.path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def fingerprint_inputs(self, paths):
+        previous = self.data.get("inputs", {})
+        return {str(path): file_fingerprint(path, previous.get(str(path))) for path in paths}
+
+    def is_fresh(self, inputs, settings):
+        if not self.data or self.data.get("settings") != settings:
+            return False
+        previous = self.data.get("inputs", {})
+        if set(previous) != set(inputs):
+            return False
+        for path, record in inputs.items():
+            old = previous.get(path)
+            if (record is None) != (old is None):
+                return False
+            if record and (record["sha1"] != old.get("sha1") or record["size"] != old.get("size")):
+                return False
+        for path, old in self.data.get("outputs", {}).items():
+            record = file_fingerprint(path, old)
+            if record is None or record["mtime"] != old.get("mtime") or record["size"] != old.get("size"):
+                return False
+        return True
+
+    def target_record(self, name):
+        return self.data.get("targets", {}).get(name)
+
+    def refresh_inputs(self, inputs):
+        # A touched but unchanged input keeps the cache valid; remember its new mtime to skip rehashing.
+        if self.data.get("inputs") != inputs:
+            self.data["inputs"] = inputs
+            self.write()
+
+    def save(self, inputs, settings, targets, outputs):
+        self.data = {
+            "version": TOOL_VERSION,
+            "settings": settings,
+            "inputs": inputs,
+            "outputs": {str(path): file_fingerprint(path) for path in outputs},
+            "targets": targets,
+        }
+        self.write()
+
+    def write(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False)
+
+
+COMPILER_SUFFIXES = ("gcc", "g++", "cc", "clang", "clang++", "armcc", "armclang", "iccarm")
+# Keil/IAR compilers run on Windows: their command lines keep backslashes as path separators.
+WINDOWS_COMPILERS = ("armcc", "armclang", "iccarm")
+SHELL_QUOTE_CHARS = ("'", '"', "\\")
+SHELL_TOKEN_RE = re.compile(r"""(?:[^\s'"\\]+|\\.|'[^']*'|"(?:[^"\\]|\\.)*")+""", re.S)
+SHELL_PART_RE = re.compile(r'[^\'"\\]+|\\(.)|\'([^\']*)\'|"((?:[^"\\]|\\.)*)"', re.S)
+SHELL_DQUOTE_ESCAPE_RE = re.compile(r'\\([\\"])')
+WINDOWS_TOKEN_RE = re.compile(r'(?:\\"|[^\s"]|"(?:\\"|[^"])*(?:"|$))+')
+IAR_LIST_OPTION_RE = re.compile(r"^-l[aAbBcCD]N?H?$")
+COMPILER_OUTPUT_OPTIONS = frozenset({"-o", "--depend", "--omf_browse", "--list"})
+
+
+def compiler_name(value):
+    name = value.replace("\\", "/").rsplit("/", 1)[-1].lower()
+    return name[:-4] if name.endswith(".exe") else name
+
+
+def command_name(line):
+    # Lowercased basename of the first word, without tokenizing the whole line unless the word is quoted.
+    words = line.split(None, 1)
+    word = words[0] if words else ""
+    if any(char in word for char in SHELL_QUOTE_CHARS):
+        tokens = split_command_line(line)
+        word = tokens[0] if tokens else ""
+    return compiler_name(word.lstrip("@").strip('"'))
+
+
+def unquote_shell_token(token):
+    parts = []
+    for match in SHELL_PART_RE.finditer(token):
+        escaped, single, double = match.groups()
+        if escaped is not None:
+            parts.append(escaped)
+        elif single is not None:
+            parts.append(single)
+        elif double is not None:
+            parts.append(SHELL_DQUOTE_ESCAPE_RE.sub(r"\1", double))
+        else:
+            parts.append(match.group())
+    return "".join(parts)
+
+
+def split_command_line(line):
+    # POSIX shlex.split() semantics for compiler command lines. Lines without quotes or backslashes are
+    # plain whitespace splits; the rest go through a precompiled token regex. Unbalanced quotes or a
+    # dangling backslash return [] like shlex's ValueError did.
+    if "'" not in line and '"' not in line and "\\" not in line:
+        return line.split()
+    tokens = SHELL_TOKEN_RE.findall(line)
+    # The token regex skips anything it cannot match (an unbalanced quote or trailing backslash), so the
+    # tokens must account for every non-blank character of the line.
+    if "".join("".join(tokens).split()) != "".join(line.split()):
+        return []
+    return [unquote_shell_token(token) if "'" in token or '"' in token or "\\" in token else token
+            for token in tokens]
+
+
+SHELL_UNSAFE_RE = re.compile(r"[^\w@%+=:,./-]", re.ASCII)
+
+
+def shell_quote(value):
+    # shlex.quote() without importing shlex on the startup path.
+    if not value:
+        return "''"
+    if SHELL_UNSAFE_RE.search(value) is None:
+        return value
+    return "'" + value.replace("'", "'\"'\"'") + "'"
+
+
+def response_file_quote(value):
+    # Double quotes with backslash escapes read the same under clang's GNU and Windows response file
+    # tokenizers; paths are already written with forward slashes.
+    if value and not any(c in value for c in ' \t"\'\\'):
+        return value
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def entry_response_files(entry):
+    # Databases written with --fields command have no arguments list.
+    args = entry["arguments"] if "arguments" in entry else split_command_line(entry.get("command", ""))
+    return [os.path.normpath(os.path.join(entry["directory"], arg[1:])) for arg in args if arg.startswith("@")]
+
+
+def entry_arguments(entry, expanded=None):
+    # The entry's arguments with @file response files read in; `expanded` holds files already read.
+    expanded = {} if expanded is None else expanded
+    args = []
+    for arg in entry["arguments"]:
+        if not arg.startswith("@"):
+            args.append(arg)
+            continue
+        path = os.path.normpath(os.path.join(entry["directory"], arg[1:]))
+        if path not in expanded:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    expanded[path] = split_command_line(f.read().replace("\n", " "))
+            except OSError:
+                expanded[path] = []
+        args.extend(expanded[path])
+    return args
+
+
+def split_windows_command_line(line):
+    # Only double quotes group and \" is a literal quote; every other backslash is kept.
+    return [token.replace('\\"', "\0").replace('"', "").replace("\0", '"') for token in WINDOWS_TOKEN_RE.findall(line)]
+
+
+class MakeOutputParser:
+    # Incremental parser for make -n output: joins backslash continuations per stream and follows
+    # "make[N]: Entering/Leaving directory" so relative sources resolve against the directory make was in.
+    DIRECTORY_RE = re.compile(r"^\S*?make(?:\.exe)?(?:\[\d+\])?: (Entering|Leaving) directory [`'\"\u2018](.*)['\"\u2019]\s*$")
+
+    def __init__(self, generator, root, paths=None):
+        self.generator = generator
+        self.paths = paths or generator.paths
+        self.directories = [str(root)]
+        self.pending = {}
+        self.entries = []
+
+    @property
+    def directory(self):
+        return self.directories[-1]
+
+    def feed(self, line, stream="stdout"):
+        line = line.rstrip("\r\n")
+        if stream in self.pending:
+            line = self.pending.pop(stream) + line
+        if line.endswith("\\") and not line.endswith("\\\\"):
+            self.pending[stream] = line[:-1]
+            return
+        self.parse_line(line)
+
+    def finish(self):
+        for stream in list(self.pending):
+            self.parse_line(self.pending.pop(stream))
+        return self.entries
+
+    def parse_line(self, line):
+        line = line.strip()
+        if not line:
+            return
+        match = self.DIRECTORY_RE.match(line)
+        if match:
+            if match.group(1) == "Entering":
+                self.directories.append(os.path.join(self.directory, match.group(2)))
+            elif len(self.directories) > 1:
+                self.directories.pop()
+            return
+        self.add_command(self.generator.parse_compile_command(line))
+
+    def add_command(self, parsed):
+        if not parsed:
+            return
+        compiler, source, args = parsed
+        directory = self.paths.resolve(self.directory)
+        if not os.path.isabs(source):
+            source = os.path.join(directory, source)
+        self.entries.append((compiler, self.paths.resolve(source).replace("\\", "/"), args, directory))
+
+
+class BuildLogParser(MakeOutputParser):
+    # Compile commands from a saved build instead of a live make: make output, iarbuild -log all output,
+    # and Keil's Objects directory, whose .dep files record every compiler invocation as
+    # "F (source)(0xTIME)(options)" and whose .__i files hold the options of one source.
+    # A Keil UV4 -o log only names the targets it built; their .dep files are read afterwards.
+    KEIL_DEP_FILE_RE = re.compile(r"^F \((.*?)\)\(0x[0-9A-Fa-f]+\)\((.*)\)\s*$")
+    KEIL_DEP_COMPILER_RE = re.compile(r"^CompilerVersion:.*::(.*?)\s*$")
+    KEIL_TARGET_RE = re.compile(r"^(?:Build|Rebuild|Batch-Build) target '(.+)'")
+
+    def __init__(self, generator, root):
+        super().__init__(generator, root)
+        self.keil_compiler = "armcc"
+        self.keil_targets = []
+
+    def read(self, path):
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                self.feed(line)
+
+    def read_keil_objects(self, directory, target=None):
+        directory = Path(directory)
+        files = sorted(p for p in directory.iterdir() if p.is_file())
+        dep_files = [p for p in files if p.suffix.lower() == ".dep"]
+        if target:
+            # <project>_<target>.dep; other targets sharing the Objects directory are left out.
+            matching = [p for p in dep_files if p.stem.endswith(f"_{target}")]
+            dep_files = matching or dep_files
+        for path in dep_files:
+            self.keil_compiler = "armcc"
+            self.read(path)
+        for path in files:
+            if path.suffix.lower() == ".__i":
+                self.read_keil_via_file(path)
+
+    def read_keil_via_file(self, path):
+        text = Path(path).read_text(encoding="utf-8", errors="replace")
+        compiler = "armclang" if "--target=" in text else "armcc"
+        self.add_command(self.generator.compile_command_from_tokens([compiler] + split_windows_command_line(text)))
+
+    def feed(self, line, stream="stdout"):
+        # Keil/IAR lines routinely end in a directory backslash (-I C:\inc\); that is not a continuation.
+        if stream not in self.pending and command_name(line).endswith(WINDOWS_COMPILERS):
+            self.parse_line(line.rstrip("\r\n"))
+            return
+        super().feed(line, stream)
+
+    def parse_line(self, line):
+        stripped = line.strip()
+        match = self.KEIL_DEP_FILE_RE.match(stripped)
+        if match:
+            source, options = match.groups()
+            tokens = [self.keil_compiler] + split_windows_command_line(options)
+            if source not in tokens:
+                tokens.append(source)
+            self.add_command(self.generator.compile_command_from_tokens(tokens))
+            return
+        match = self.KEIL_DEP_COMPILER_RE.match(stripped)
+        if match:
+            self.keil_compiler = "armclang" if "CLANG" in match.group(1).upper() else "armcc"
+            return
+        match = self.KEIL_TARGET_RE.match(stripped)
+        if match:
+            if match.group(1) not in self.keil_targets:
+                self.keil_targets.append(match.group(1))
+            return
+        super().parse_line(line)
+
+
+def dedupe_compile_entries(results):
+    # Merge lists of (compiler, source, args, directory); the first entry for a source wins.
+    entries = []
+    seen = set()
+    for result in results:
+        for entry in result:
+            key = path_dedupe_key(entry[1])
+            if key in seen:
+                continue
+            seen.add(key)
+            entries.append(entry)
+    return entries
+
+
+INCLUDE_RE = re.compile(rb'^[ \t]*#[ \t]*include[ \t]*([<"])([^>"\r\n]+)[>"]', re.M)
+HEADER_SUFFIXES = (".h", ".hh", ".hpp", ".hxx", ".inc")
+CXX_SOURCE_SUFFIXES = (".cc", ".cpp", ".cxx")
+DEPFILE_TARGET_RE = re.compile(r"^((?:[A-Za-z]:)?[^:]*):(?:\s|$)")
+INCLUDE_OPTIONS = ("-I", "-iquote", "-isystem", "-idirafter")
+# .d files are written next to the objects, so the dependency file search walks into build output dirs.
+DEPFILE_IGNORE_DIRS = (DEFAULT_IGNORE_DIRS - {"objects", "listings", "build", "debug", "release"}) | {STATE_DIR_NAME}
+
+
+CLANGD_MARKER = "# Generated by Keil2Json --clangd."
+# Directory names under which in-tree code is vendored: its include dirs become system headers and the
+# background index skips it. config.json "clangd.vendor_dirs" adds more.
+CLANGD_VENDOR_DIRS = (
+    "CMSIS", "*_HAL_Driver", "*_StdPeriph_Driver", "Middlewares", "Third_Party", "ThirdParty", "third_party",
+    "vendor", "external", "RTE",
+)
+# GCC, armcc and IAR options clang rejects, as written in make and build log command lines.
+CLANGD_UNSUPPORTED_FLAGS = (
+    "-mthumb-interwork", "-mno-thumb-interwork", "-mpoke-function-name", "-fstack-usage", "-fcallgraph-info*",
+    "-fcyclomatic-complexity", "-fconserve-stack", "-finline-limit=*", "-fanalyzer", "-specs=*", "--specs=*",
+    "-fdump-*", "-fipa-*", "-fno-ipa-*", "-ftree-*", "-fno-tree-*", "-fno-reorder-functions",
+    "-fno-allow-store-data-races", "-fno-aggressive-loop-optimizations",
+    "--cpu=*", "--fpu=*", "--apcs=*", "--split_sections", "--c99", "--gnu", "--li", "--diag_suppress=*",
+    "-Otime", "-Ospace", "--endian=*", "--no_*", "--silent", "-On", "-Ol", "-Om", "-Oh*",
+)
+# armcc and IAR options that take their value as the next argument ("--cpu Cortex-M4.fp.sp"). .clangd
+# Remove would leave the value behind as an input file, so --clangd drops both from the entries.
+CLANGD_UNSUPPORTED_VALUE_FLAGS = frozenset({
+    "--cpu", "--fpu", "--apcs", "--endian", "--cpu_mode", "--diag_suppress", "--diag_warning", "--diag_error",
+    "--diag_remark", "--dlib_config", "--depend", "--dependencies", "--omf_browse", "--list",
+})
+POSIX_REGEX_SPECIAL = frozenset(".[]()*+?{}|^$\\")
+
+
+def clangd_path_regex(path):
+    # clangd PathMatch is a POSIX extended regex matched against the whole relative path.
+    return "".join("\\" + c if c in POSIX_REGEX_SPECIAL else c for c in path) + "/.*"
+
+
+def shared_path_length(first, second):
+    # Length of the common directory prefix; paths on different Windows drives share none.
+    try:
+        return len(os.path.commonpath([first, second]))
+    except ValueError:
+        return 0
+
+
+def parse_depfile(text):
+    # GCC -MD files ("object: dep dep" with backslash continuations) and Keil --depend files (one
+    # "object: dep" per line). Returns {object: [deps]} with dependencies in order.
+    rules = OrderedDict()
+    for line in text.replace("\\\r\n", " ").replace("\\\n", " ").splitlines():
+        match = DEPFILE_TARGET_RE.match(line)
+        if not match:
+            continue
+        deps = rules.setdefault(match.group(1).strip(), [])
+        rest = line[match.end():].replace("\\ ", "\0")
+        deps.extend(value.replace("\0", " ") for value in rest.split())
+    return rules
+
+
+class HeaderMap:
+    # --headers: which translation units include each project header, from .d files when the build left
+    # them or from scanning #include directives. Per-file include lists are cached by mtime and size in
+    # .keil2json/includes.json; resolution follows each TU's own -I order.
+    def __init__(self, root, cache_path, max_depth=16):
+        self.root = os.path.normpath(str(root))
+        self.cache_path = Path(cache_path)
+        self.max_depth = max_depth
+        self.includes = {}
+        self.exists = {}
+        self.resolved = {}
+        self.changed = False
+        self.cached = self.load()
+
+    def load(self):
+        try:
+            with self.cache_path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get("version") != TOOL_VERSION:
+            return {}
+        return data.get("files", {})
+
+    def save(self):
+        if not self.changed:
+            return
+        files = {path: record for path, record in self.cached.items() if path in self.includes}
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        temp = self.cache_path.with_name(f".{self.cache_path.name}.{os.getpid()}.tmp")
+        try:
+            with temp.open("w", encoding="utf-8") as f:
+                json.dump({"version": TOOL_VERSION, "files": files}, f, ensure_ascii=False)
+            os.replace(temp, self.cache_path)
+        except OSError:
+            pass
+        finally:
+            if temp.exists():
+                temp.unlink()
+
+    def scan(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return path, None, []
+        stamp = [stat.st_mtime_ns, stat.st_size]
+        record = self.cached.get(path)
+        if record and record[:2] == stamp:
+            return path, None, record[2]
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return path, None, []
+        includes = [[quote.decode("ascii"), name.decode("utf-8", "replace").strip()]
+                    for quote, name in INCLUDE_RE.findall(data)]
+        return path, stamp + [includes], includes
+
+    def scan_all(self, paths):
+        pending = [path for path in paths if path not in self.includes]
+        if not pending:
+            return
+        if len(pending) > 16:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as pool:
+                results = list(pool.map(self.scan, pending))
+        else:
+            results = [self.scan(path) for path in pending]
+        for path, record, includes in results:
+            self.includes[path] = includes
+            if record is not None:
+                TIMINGS.count("include scans")
+                self.cached[path] = record
+                self.changed = True
+
+    def is_file(self, path):
+        cached = self.exists.get(path)
+        if cached is None:
+            cached = self.exists[path] = os.path.isfile(path)
+        return cached
+
+    def resolve(self, include_dirs, current_dir, quote, name):
+        key = (include_dirs, current_dir if quote == '"' else None, name)
+        if key in self.resolved:
+            return self.resolved[key]
+        result = None
+        if os.path.isabs(name):
+            result = os.path.normpath(name) if self.is_file(name) else None
+        else:
+            for directory in ((current_dir,) + include_dirs if quote == '"' else include_dirs):
+                candidate = os.path.normpath(os.path.join(directory, name))
+                if self.is_file(candidate):
+                    result = candidate
+                    break
+        self.resolved[key] = result
+        return result
+
+    def owners(self, units, depfiles):
+        # units: [(source, include_dirs)] in entry order. Returns {header: [(depth, unit index)]}; depth is
+        # how many #include steps separate the header from the unit (1 for every .d dependency).
+        owners = {}
+        level = []
+        for index, (source, include_dirs) in enumerate(units):
+            deps = depfiles.get(path_dedupe_key(source))
+            if deps is not None:
+                for header in deps:
+                    owners.setdefault(header, []).append((1, index))
+            else:
+                level.append((index, source))
+        visited = [set() for _ in units]
+        depth = 0
+        while level and depth < self.max_depth:
+            depth += 1
+            self.scan_all({path for _, path in level})
+            next_level = []
+            for index, path in level:
+                include_dirs = units[index][1]
+                current_dir = os.path.dirname(path)
+                for quote, name in self.includes.get(path, ()):
+                    header = self.resolve(include_dirs, current_dir, quote, name)
+                    if header is None or header in visited[index]:
+                        continue
+                    visited[index].add(header)
+                    owners.setdefault(header, []).append((depth, index))
+                    next_level.append((index, header))
+            level = next_level
+        return owners
+
+    def read_depfiles(self, sources, max_depth=None, ignore=()):
+        # Dependencies per unit from every .d file under the project; a unit is the first source-file
+        # dependency of a rule. Relative paths are taken from the project root, where make and Keil run.
+        # The walk follows project discovery (--max-depth, --ignore) but enters build output dirs.
+        wanted = {path_dedupe_key(source) for source in sources}
+        depfiles = {}
+        for directory, filenames in walk_directories(self.root, max_depth, ignore, DEPFILE_IGNORE_DIRS):
+            for filename in filenames:
+                if not filename.endswith(".d"):
+                    continue
+                try:
+                    with open(os.path.join(directory, filename), "r", encoding="utf-8", errors="replace") as f:
+                        rules = parse_depfile(f.read())
+                except OSError:
+                    continue
+                TIMINGS.count("dep files")
+                for deps in rules.values():
+                    paths = [os.path.normpath(os.path.join(self.root, value)) for value in deps]
+                    source = next((p for p in paths if not p.lower().endswith(HEADER_SUFFIXES)), None)
+                    if source is None or path_dedupe_key(source) not in wanted:
+                        continue
+                    headers = depfiles.setdefault(path_dedupe_key(source), [])
+                    headers.extend(p for p in paths if p.lower().endswith(HEADER_SUFFIXES) and p not in headers)
+        return depfiles
+
+
+class IncludePruner:
+    # --prune-includes: drops include dirs that are missing or empty and, with reorder, moves the dirs that
+    # resolve the most headers forward. A dir only moves ahead of another when no header name used by
+    # the sources exists in both, so every #include keeps resolving to the same file.
+    def __init__(self, header_map, reorder=False):
+        self.headers = header_map
+        self.reorder = reorder
+        self.usable = {}
+        self.usage = OrderedDict()
+        self.dropped = set()
+        self.probes_before = 0
+        self.probes_after = 0
+
+    @staticmethod
+    def has_entries(path):
+        try:
+            with os.scandir(path) as entries:
+                return next(entries, None) is not None
+        except OSError:
+            return False
+
+    def check_dirs(self, dirs):
+        pending = [path for path in dict.fromkeys(dirs) if path not in self.usable]
+        if len(pending) > 8:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=min(16, len(pending))) as pool:
+                results = list(pool.map(self.has_entries, pending))
+        else:
+            results = [self.has_entries(path) for path in pending]
+        self.usable.update(zip(pending, results))
+
+    def directives(self, sources, dirs):
+        # Every (quote, name, including dir) reachable from the sources through the original order.
+        found = OrderedDict()
+        visited = set(sources)
+        level = list(visited)
+        while level:
+            self.headers.scan_all(level)
+            next_level = []
+            for path in level:
+                current_dir = os.path.dirname(path)
+                for quote, name in self.headers.includes.get(path, ()):
+                    found[(quote, name, current_dir if quote == '"' else None)] = None
+                    header = self.headers.resolve(dirs, current_dir, quote, name)
+                    if header is not None and header not in visited:
+                        visited.add(header)
+                        next_level.append(header)
+            level = next_level
+        return list(found)
+
+    def probes(self, directives, dirs):
+        # stat() calls a compiler makes: the including dir for "" includes, then each -I dir in turn.
+        # Also returns the file and the -I dir each directive resolves to.
+        total = 0
+        winners = []
+        owners = []
+        for quote, name, current_dir in directives:
+            winner = self.headers.resolve(dirs, current_dir, quote, name)
+            winners.append(winner)
+            owner = None
+            if quote == '"':
+                total += 1
+                if winner is not None and winner == os.path.normpath(os.path.join(current_dir, name)):
+                    owners.append(owner)
+                    continue
+            if winner is None:
+                total += len(dirs)
+            else:
+                for index, directory in enumerate(dirs):
+                    if os.path.normpath(os.path.join(directory, name)) == winner:
+                        total += index + 1
+                        owner = directory
+                        break
+            owners.append(owner)
+        return total, winners, owners
+
+    def plan(self, dirs, sources):
+        dirs = tuple(dirs)
+        kept = tuple(path for path in dirs if self.usable.get(path, True))
+        self.dropped.update(path for path in dirs if path not in kept)
+        directives = [d for d in self.directives(sources, dirs) if not os.path.isabs(d[1])]
+        before, winners, owners = self.probes(directives, dirs)
+        usage = dict.fromkeys(kept, 0)
+        for owner in owners:
+            if owner is not None:
+                usage[owner] += 1
+        for path, count in usage.items():
+            self.usage[path] = self.usage.get(path, 0) + count
+        order = kept
+        if self.reorder and len(kept) > 1:
+            order = self.reordered(kept, directives, usage)
+            if self.probes(directives, order)[1] != winners:
+                order = kept
+        self.probes_before += before
+        self.probes_after += self.probes(directives, order)[0]
+        return order
+
+    def reordered(self, kept, directives, usage):
+        # Topological order of "the winning dir of a name goes before every other dir holding that name",
+        # picking the most used dir first and the original position on ties.
+        import heapq
+
+        edges = {path: set() for path in kept}
+        indegree = dict.fromkeys(kept, 0)
+        for _, name, _ in directives:
+            holders = [path for path in kept if self.headers.is_file(os.path.normpath(os.path.join(path, name)))]
+            for other in holders[1:]:
+                if other not in edges[holders[0]]:
+                    edges[holders[0]].add(other)
+                    indegree[other] += 1
+        position = {path: index for index, path in enumerate(kept)}
+        ready = [(-usage[path], position[path], path) for path in kept if not indegree[path]]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            _, _, path = heapq.heappop(ready)
+            order.append(path)
+            for other in edges[path]:
+                indegree[other] -= 1
+                if not indegree[other]:
+                    heapq.heappush(ready, (-usage[other], position[other], other))
+        return tuple(order)
+
+
+def entry_include_dirs(entry, expanded=None):
+    directory = entry["directory"]
+    args = entry_arguments(entry, expanded)
+    dirs = []
+    index = 0
+    while index < len(args):
+        token = args[index]
+        index += 1
+        for option in INCLUDE_OPTIONS:
+            if token == option and index < len(args):
+                value = args[index]
+                index += 1
+            elif token.startswith(option) and len(token) > len(option):
+                value = token[len(option):]
+            else:
+                continue
+            dirs.append(os.path.normpath(os.path.join(directory, value)))
+            break
+    return tuple(dirs)
+
+
 class CompileCommandsGenerator:
-    def __init__(self, path=None, absolute=False, config_manager=None, dry_run=False):
+    def __init__(self, path=None, absolute=False, config_manager=None, dry_run=False,
+                 max_depth=None, ignore=None, verbose=False, stream=False,
+                 target=None, all_targets=False, use_cache=True, output_format="pretty", fields="both",
+                 make_clean=True, make_jobs=None, make_dirs=None, from_log=None, workspace=False,
+                 headers=False, response_files=False, clangd=False, prune_includes=None, response_dir=None):
         self.path = Path(path).expanduser() if path and str(path).strip() else Path.cwd()
         self.absolute = absolute
         self.config_manager = config_manager or ConfigManager()
         self.dry_run = dry_run
+        if max_depth is None:
+            max_depth = self.config_manager.config.get("discovery", {}).get("max_depth")
+        self.max_depth = max_depth if max_depth is None or max_depth >= 0 else None
+        self.ignore = list(self.config_manager.get("discovery", "ignore") or []) + list(ignore or [])
+        self.verbose = verbose
+        self.stream = stream
+        self.target = target
+        self.all_targets = all_targets
+        self.use_cache = use_cache
+        self.output_format = output_format
+        self.fields = fields
+        self.last_write_changed = False
+        self.make_clean = make_clean
+        self.make_jobs = make_jobs
+        self.make_dirs = list(make_dirs or [])
+        self.from_log = from_log
+        self.workspace = workspace
+        self.headers = headers
+        self.response_files = response_files
+        # Workspace projects write their response files next to the workspace database, not their own.
+        self.response_dir = Path(response_dir) if response_dir else None
+        self.clangd = clangd
+        self.prune_includes = prune_includes
+        self.include_plans = {}
+        self.written_response_files = set()
+        self.system_roots = None
+        # .pdsc files and directories (pack versions, RTE/_<Target>) pack resolution read; see cache_inputs().
+        self.pack_files = set()
+        self.pack_dirs = set()
+        self.system_includes = {}
         self.project_root = None
-        self.compiler = "arm-none-eabi-gcc"
-        self.extra_args = ["-D__GNUC__"]
+        self.option_sets = {}
+        self.flag_sets = {}
+        self.paths = PathNormalizer()
+        self.project_file = None
 
     def unique(self, items):
         seen = set()
@@ -677,46 +2557,131 @@ class CompileCommandsGenerator:
             output.append(str(item))
         return output
 
-    def format_path(self, value):
-        path = Path(value).resolve()
-        if self.absolute:
-            return str(path).replace("\\", "/")
-        try:
-            return os.path.relpath(str(path), str(self.project_root)).replace("\\", "/")
-        except ValueError:
-            return str(path).replace("\\", "/")
+    def format_path(self, value, base=None):
+        return self.paths.format(value, base or str(self.project_root), self.absolute)
 
     def resolve_project_path(self, base, value):
         value = value.strip().strip('"').replace("\\", "/")
         if not value:
             return ""
-        path = Path(value)
-        if path.is_absolute():
-            return str(path.resolve()).replace("\\", "/")
-        return str((base / path).resolve()).replace("\\", "/")
-
-    def parse_uvprojx(self, file_path):
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        include_paths = []
-        defines = []
+        if not os.path.isabs(value):
+            value = os.path.join(str(base), value)
+        return self.paths.resolve(value).replace("\\", "/")
+
+    def read_project(self, project_file):
+        if isinstance(project_file, ProjectSummary):
+            return project_file
+        if isinstance(project_file, ProjectDocument):
+            return project_file.summary()
+        path = Path(project_file)
+        with TIMINGS.phase("read project"):
+            if self.stream or (path.suffix.lower() == ".uvprojx" and path.stat().st_size >= STREAM_THRESHOLD):
+                return StreamingProjectReader(path).read()
+            return ProjectDocument.open(path).summary()
+
+    def project_target(self, summary, target=None):
+        if isinstance(target, TargetSummary):
+            return target
+        if target:
+            selected = summary.target(target)
+            if selected is None:
+                names = ", ".join(f"'{t.name}'" for t in summary.targets)
+                raise ValueError(f"target '{target}' was not found, available: {names}")
+            return selected
+        return summary.targets[0]
+
+    def select_targets(self, summary):
+        if not self.all_targets:
+            return [self.project_target(summary, self.target)]
+        targets = list(summary.targets)
+        if self.target:
+            # The requested target goes first so it also lands in the root compile_commands.json.
+            selected = self.project_target(summary, self.target)
+            targets.remove(selected)
+            targets.insert(0, selected)
+        return targets
 
-        controls = root.find(".//TargetArmAds/Cads/VariousControls")
-        if controls is not None:
-            include_elem = controls.find("IncludePath")
-            if include_elem is not None and include_elem.text:
-                include_paths.extend(include_elem.text.split(";"))
-            define_elem = controls.find("Define")
-            if define_elem is not None and define_elem.text:
-                defines.extend(define_elem.text.split(","))
+    @staticmethod
+    def target_dir_name(name):
+        return re.sub(r"[^A-Za-z0-9._-]+", "_", name).strip("._") or "default"
+
+    def target_output(self, target, targets=()):
+        # "A B" and "A_B" sanitize alike, and directory names may be case-insensitive; a target sharing
+        # its directory with another one (or with rsp/) gets a short hash of its raw name appended.
+        name = self.target_dir_name(target.name)
+        taken = {"rsp"} | {self.target_dir_name(other.name).lower() for other in targets if other.name != target.name}
+        if name.lower() in taken:
+            name = f"{name}-{hashlib.sha1(target.name.encode('utf-8')).hexdigest()[:8]}"
+        return self.project_root / STATE_DIR_NAME / name / "compile_commands.json"
+
+    def device_pack_options(self, summary, target):
+        # Include dirs and defines Keil adds from the target's device pack and RTE components, plus the
+        # generated RTE/_<Target> directory holding RTE_Components.h.
+        key = ("pack", target.name, tuple(sorted(target.device.items())))
+        cached = self.option_sets.get(key)
+        if cached is None:
+            with TIMINGS.phase("packs"):
+                cached = self.option_sets[key] = self.resolve_device_packs(summary, target)
+        return cached
+
+    def resolve_device_packs(self, summary, target):
+        includes = []
+        defines = []
+        components = summary.target_components(target)
+        if components:
+            rte_dir = self.project_root / "RTE" / ("_" + re.sub(r"\W", "_", target.name))
+            self.pack_dirs.add(str(rte_dir))
+            if rte_dir.is_dir():
+                includes.append(str(rte_dir))
+            defines.append("_RTE_")
+
+        keil_path = self.config_manager.get("keil", "install_path")
+        pack_roots = keil_pack_roots(keil_path) if keil_path else []
+        pack_id = split_pack_id(target.device.get("PackID", ""))
+        if pack_roots and pack_id and target.device.get("Device"):
+            pack_dir = find_pack_dir(pack_roots, *pack_id)
+            index = self.open_pack(pack_roots, pack_id, pack_dir)
+            device = index.device(target.device["Device"]) if index else None
+            if device:
+                includes.extend(str(pack_dir / value) for value in device["includes"])
+                defines.extend(device["defines"])
+            elif self.verbose:
+                print(f"  target '{target.name}': device {target.device['Device']} not found in pack {'.'.join(pack_id)}")
+        for cclass, cgroup, csub, cvariant, pack, _ in components:
+            if not (pack_roots and pack[0] and pack[1]):
+                continue
+            pack_dir = find_pack_dir(pack_roots, *pack)
+            index = self.open_pack(pack_roots, pack, pack_dir)
+            if index:
+                includes.extend(str(pack_dir / value) for value in index.component_includes(cclass, cgroup, csub, cvariant))
+
+        return tuple(self.unique(includes)), tuple(self.unique(defines))
+
+    def open_pack(self, pack_roots, pack, pack_dir):
+        # Records what the lookup depended on: the installed versions under every pack root, the chosen
+        # version's directory (which .pdsc it holds) and the .pdsc itself.
+        self.pack_dirs.update(str(Path(root) / pack[0] / pack[1]) for root in pack_roots)
+        if not pack_dir:
+            return None
+        self.pack_dirs.add(str(pack_dir))
+        index = PackIndex.open(pack_dir)
+        if index:
+            self.pack_files.add(index.data["pdsc"])
+        return index
+
+    def keil_option_set(self, include_paths, defines, compiler_type, pack_options=((), ())):
+        key = ("keil", compiler_type, tuple(include_paths), tuple(defines), pack_options)
+        cached = self.option_sets.get(key)
+        if cached is not None:
+            return cached
 
         abs_includes = []
         for include in include_paths:
             resolved = self.resolve_project_path(self.project_root, include)
             if resolved:
                 abs_includes.append(resolved)
+        abs_includes.extend(value.replace("\\", "/") for value in pack_options[0])
 
-        compiler_type = detect_keil_compiler_type(file_path)
         cmsis = self.config_manager.get("keil", "cmsis_path")
         if cmsis:
             abs_includes.append(cmsis)
@@ -727,45 +2692,15 @@ class CompileCommandsGenerator:
         if toolchain_include:
             abs_includes.append(toolchain_include)
 
-        source_files = []
-        for group in root.findall(".//Group"):
-            for file_elem in group.findall(".//File"):
-                path_elem = file_elem.find("FilePath")
-                if path_elem is None or not path_elem.text:
-                    continue
-                source = self.resolve_project_path(self.project_root, path_elem.text)
-                if source:
-                    source_files.append(source)
-
-        return self.unique(abs_includes), self.unique([d.strip() for d in defines]), self.unique(source_files)
-
-    def parse_ewp(self, file_path):
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-        include_paths = []
-        defines = []
-        source_files = []
+        cached = self.unique(abs_includes), self.unique([d.strip() for d in defines] + list(pack_options[1]))
+        self.option_sets[key] = cached
+        return cached
 
-        for option in root.findall(".//configuration/settings/data/option"):
-            name_elem = option.find("name")
-            if name_elem is None or not name_elem.text:
-                continue
-            values = [s.text.strip() for s in option.findall("state") if s.text and s.text.strip()]
-            option_name = name_elem.text.strip()
-            if option_name in {"CCIncludePath2", "CCIncludePath"}:
-                include_paths.extend(values)
-            elif option_name in {"CCDefines", "CCDefines2"}:
-                defines.extend(values)
-
-        for group in root.findall(".//group"):
-            for file_elem in group.findall("file"):
-                name_elem = file_elem.find("name")
-                if name_elem is None or not name_elem.text:
-                    continue
-                value = name_elem.text.strip().replace("$PROJ_DIR$", ".")
-                source = self.resolve_project_path(self.project_root, value)
-                if source:
-                    source_files.append(source)
+    def iar_option_set(self, include_paths, defines):
+        key = ("iar", tuple(include_paths), tuple(defines))
+        cached = self.option_sets.get(key)
+        if cached is not None:
+            return cached
 
         abs_includes = []
         for include in include_paths:
@@ -774,18 +2709,14 @@ class CompileCommandsGenerator:
             if resolved:
                 abs_includes.append(resolved)
 
-        for key in ("cmsis_path", "c_include"):
-            include = self.config_manager.get("iar", key)
+        for key_name in ("cmsis_path", "c_include"):
+            include = self.config_manager.get("iar", key_name)
             if include:
                 abs_includes.append(include)
 
-        return self.unique(abs_includes), self.unique([d.strip() for d in defines]), self.unique(source_files)
-
-    def shell_split(self, value):
-        try:
-            return shlex.split(value, posix=True)
-        except ValueError:
-            return []
+        cached = self.unique(abs_includes), self.unique([d.strip() for d in defines])
+        self.option_sets[key] = cached
+        return cached
 
     def is_source_file(self, value):
         return value.lower().endswith((".c", ".cc", ".cpp", ".cxx", ".s", ".S"))
@@ -793,12 +2724,25 @@ class CompileCommandsGenerator:
     def is_compiler_command(self, tokens):
         if not tokens:
             return False
-        compiler = Path(tokens[0].lstrip("@").strip('"')).name.lower()
-        return compiler.endswith(("gcc", "g++", "cc", "clang", "clang++"))
+        return compiler_name(tokens[0].lstrip("@").strip('"')).endswith(COMPILER_SUFFIXES)
 
     def parse_compile_command(self, line):
-        tokens = self.shell_split(line)
-        if not self.is_compiler_command(tokens) or "-c" not in tokens:
+        # Most make/IDE output lines are not compiles; reject them before paying for tokenization.
+        name = command_name(line)
+        if not name.endswith(COMPILER_SUFFIXES):
+            return None
+        if "-c" not in line and not name.endswith("iccarm"):
+            return None
+        if name.endswith(WINDOWS_COMPILERS):
+            return self.compile_command_from_tokens(split_windows_command_line(line))
+        return self.compile_command_from_tokens(split_command_line(line))
+
+    def compile_command_from_tokens(self, tokens):
+        if not self.is_compiler_command(tokens):
+            return None
+        # iccarm compiles without -c; it writes its object, list and dependency files next to -o.
+        iar = compiler_name(tokens[0].lstrip("@").strip('"')).endswith("iccarm")
+        if "-c" not in tokens and not iar:
             return None
 
         compiler = tokens[0].lstrip("@")
@@ -809,10 +2753,13 @@ class CompileCommandsGenerator:
             if skip_next:
                 skip_next = False
                 continue
-            if token == "-o":
+            if token in COMPILER_OUTPUT_OPTIONS:
                 skip_next = True
                 continue
-            if token.startswith("-o") and token != "-o":
+            if token.startswith("-o") or token.startswith(("--depend=", "--omf_browse=", "--list=")):
+                continue
+            if iar and (token.startswith("--dependencies") or IAR_LIST_OPTION_RE.match(token)):
+                skip_next = True
                 continue
             if token.startswith("-M"):
                 if token in {"-MF", "-MT", "-MQ"}:
@@ -828,115 +2775,739 @@ class CompileCommandsGenerator:
             return None
         return compiler, source_file, filtered_args
 
-    def run_make_command(self, args):
-        return subprocess.run(
+    def run_make_command(self, args, capture=True):
+        import subprocess
+
+        TIMINGS.count("subprocesses")
+        with TIMINGS.phase("subprocess"):
+            if not capture:
+                return subprocess.run(args, cwd=self.project_root, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            return subprocess.run(
+                args,
+                cwd=self.project_root,
+                capture_output=True,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+            )
+
+    def stream_make_command(self, args, consume, cwd=None):
+        # Both pipes are drained by reader threads into a bounded queue and handed to consume() line by
+        # line, so memory does not grow with the size of the make output.
+        import queue
+        import subprocess
+        import threading
+
+        TIMINGS.count("subprocesses")
+        start = time.perf_counter()
+        process = subprocess.Popen(
             args,
-            cwd=self.project_root,
-            capture_output=True,
+            cwd=cwd or self.project_root,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
             text=True,
             encoding="utf-8",
             errors="replace",
         )
+        lines = queue.Queue(maxsize=4096)
+
+        def pump(pipe, name):
+            try:
+                for line in pipe:
+                    lines.put((name, line))
+            finally:
+                pipe.close()
+                lines.put((name, None))
+
+        readers = [
+            threading.Thread(target=pump, args=(process.stdout, "stdout"), daemon=True),
+            threading.Thread(target=pump, args=(process.stderr, "stderr"), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+        open_streams = len(readers)
+        while open_streams:
+            name, line = lines.get()
+            if line is None:
+                open_streams -= 1
+                continue
+            consume(line, name)
+        for reader in readers:
+            reader.join()
+        returncode = process.wait()
+        TIMINGS.add("subprocess", time.perf_counter() - start)
+        return returncode
+
+    def check_make_result(self, command, returncode):
+        if returncode != 0:
+            print(f"Warning: {' '.join(command)} returned {returncode}")
 
     def parse_makefile(self):
+        with TIMINGS.phase("make"):
+            return self.capture_makefile()
+
+    def capture_makefile(self):
         makefile = self.project_root / "Makefile"
         if not makefile.exists():
             makefile = self.project_root / "makefile"
         if not makefile.exists():
             raise FileNotFoundError("cannot find Makefile or makefile")
 
-        print("Running: make clean")
-        clean_result = self.run_make_command(["make", "clean"])
-        if clean_result.returncode != 0:
-            print(f"Warning: make clean returned {clean_result.returncode}")
+        build_command = ["make"] + ([f"-j{self.make_jobs}"] if self.make_jobs else [])
+        if self.make_clean:
+            print("Running: make clean")
+            clean_result = self.run_make_command(["make", "clean"], capture=False)
+            if clean_result.returncode != 0:
+                print(f"Warning: make clean returned {clean_result.returncode}")
 
-        print("Running: make -n")
-        dry_result = self.run_make_command(["make", "-n"])
-        if dry_result.returncode != 0:
-            print(f"Warning: make -n returned {dry_result.returncode}")
+            entries = self.capture_make_commands(["make", "-n"])
 
-        if not self.dry_run:
-            print("Running: make")
-            build_result = self.run_make_command(["make"])
-            if build_result.returncode != 0:
-                print(f"Warning: make returned {build_result.returncode}")
-
-        lines = dry_result.stdout.splitlines() + dry_result.stderr.splitlines()
-        entries = []
-        for line in lines:
-            parsed = self.parse_compile_command(line.strip())
-            if not parsed:
-                continue
-            compiler, source, args = parsed
-            source_path = Path(source)
-            if not source_path.is_absolute():
-                source_path = self.project_root / source_path
-            entries.append((compiler, str(source_path.resolve()).replace("\\", "/"), args))
+            if not self.dry_run:
+                print(f"Running: {' '.join(build_command)}")
+                self.check_make_result(build_command, self.run_make_command(build_command, capture=False).returncode)
+        else:
+            # make -n -B prints every rule without touching build artifacts, so nothing has to be cleaned
+            # and the real build can run alongside the capture.
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                build_future = None
+                if not self.dry_run:
+                    print(f"Running in background: {' '.join(build_command)}")
+                    build_future = pool.submit(self.run_make_command, build_command, False)
+                entries = self.capture_make_commands(["make", "-n", "-B"])
+                if build_future is not None:
+                    self.check_make_result(build_command, build_future.result().returncode)
 
         if not entries:
             raise RuntimeError("no compile commands found from make -n output")
         return entries
 
-    def generate_entries(self, include_paths, defines, source_files):
-        compile_dir = str(self.project_root).replace("\\", "/")
-        includes = [self.format_path(p) for p in self.unique(include_paths)]
-        defines = self.unique(defines)
-        base_args = self.extra_args + [f"-I{p}" for p in includes] + [f"-D{d}" for d in defines]
-        entries = []
-        for source in source_files:
-            file_arg = self.format_path(source)
-            args = [self.compiler, "-c", file_arg] + base_args
-            entries.append({
-                "command": " ".join(shlex.quote(a) for a in args),
-                "arguments": args,
-                "directory": compile_dir,
-                "file": file_arg,
-            })
+    def capture_make_directory(self, command, directory, paths=None):
+        parser = MakeOutputParser(self, directory, paths)
+        self.check_make_result(command, self.stream_make_command(command, parser.feed, cwd=directory))
+        return parser.finish()
+
+    def capture_make_commands(self, command):
+        # With --make_dirs every listed directory is captured by its own make -n process in parallel.
+        # Results are merged in the listed order and the first entry for a source wins.
+        if not self.make_dirs:
+            print(f"Running: {' '.join(command)}")
+            return self.capture_make_directory(command, str(self.project_root))
+
+        directories = []
+        for value in self.make_dirs:
+            directory = self.resolve_project_path(self.project_root, value)
+            if directory not in directories:
+                directories.append(directory)
+        for directory in directories:
+            print(f"Running: {' '.join(command)} (in {directory})")
+        from concurrent.futures import ThreadPoolExecutor
+
+        def capture(directory):
+            # The path caches are not thread safe: each worker resolves through its own normalizer.
+            paths = PathNormalizer()
+            return self.capture_make_directory(command, directory, paths), paths
+
+        workers = min(len(directories), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(capture, directories))
+        for _, paths in results:
+            self.paths.add_counts(paths)
+        return dedupe_compile_entries([entries for entries, _ in results])
+
+    def parse_build_log(self, project_file=None):
+        log_path = Path(self.from_log).expanduser().resolve()
+        if not log_path.exists():
+            raise FileNotFoundError(f"build log not found: {log_path}")
+        parser = BuildLogParser(self, str(self.project_root))
+        if log_path.is_dir():
+            print(f"Reading Keil objects: {log_path}")
+            parser.read_keil_objects(log_path)
+        else:
+            print(f"Reading build log: {log_path}")
+            parser.read(log_path)
+
+        if parser.keil_targets and not parser.entries:
+            # A UV4 log has no command lines; the real options are in the built targets' .dep files.
+            if project_file is None or project_file.suffix.lower() != ".uvprojx":
+                raise RuntimeError("Keil build log found but no .uvprojx project to locate its Objects directory")
+            document = ProjectDocument.open(project_file)
+            for target in parser.keil_targets:
+                directory = document.output_directory(target)
+                directory = self.resolve_project_path(self.project_root, directory) if directory else ""
+                if directory and os.path.isdir(directory):
+                    print(f"Reading Keil objects for target '{target}': {directory}")
+                    parser.read_keil_objects(directory, target)
+                else:
+                    print(f"Warning: Objects directory of target '{target}' not found")
+
+        entries = dedupe_compile_entries([parser.finish()])
+        if not entries:
+            raise RuntimeError(f"no compile commands found in {log_path}")
         return entries
 
-    def format_make_arg_path(self, value):
-        path = Path(value)
-        if not path.is_absolute():
-            path = self.project_root / path
-        return self.format_path(path)
+    def header_entries(self, entries):
+        # Project headers get the flags of the unit that includes them most directly; ties go to the unit
+        # sharing the longest directory prefix with the header, then to the first one in the database.
+        with TIMINGS.phase("headers"):
+            root = os.path.normpath(str(self.project_root))
+            header_map = HeaderMap(root, self.project_root / STATE_DIR_NAME / "includes.json")
+            units = []
+            owners_of = []
+            expanded = {}
+            for entry in entries:
+                source = os.path.normpath(os.path.join(entry["directory"], entry["file"]))
+                if source.lower().endswith((".s", ".asm")):
+                    continue
+                units.append((source, entry_include_dirs(entry, expanded)))
+                owners_of.append(entry)
+            depfiles = header_map.read_depfiles((source for source, _ in units), self.max_depth, self.ignore)
+            owners = header_map.owners(units, depfiles)
+            header_map.save()
+
+            existing = {path_dedupe_key(os.path.normpath(os.path.join(e["directory"], e["file"]))) for e in entries}
+            prefix = root + os.sep
+            results = []
+            for header, candidates in owners.items():
+                if not header.startswith(prefix) or path_dedupe_key(header) in existing:
+                    continue
+                if not header.lower().endswith(HEADER_SUFFIXES):
+                    continue
+                header_dir = os.path.dirname(header)
+                _, _, index = min(
+                    (depth, -shared_path_length(header_dir, os.path.dirname(units[i][0])), i)
+                    for depth, i in candidates
+                )
+                existing.add(path_dedupe_key(header))
+                results.append(self.header_entry(owners_of[index], header))
+        results.sort(key=lambda entry: entry["file"])
+        TIMINGS.count("header entries", len(results))
+        print(f"  headers: {len(results)} header entries from {len(units)} translation units "
+              f"({len(depfiles)} from .d files)")
+        return results
+
+    def header_entry(self, owner, header):
+        directory = owner["directory"]
+        # Same path style as the owner's file: make entries keep whatever style the build used.
+        file_arg = self.paths.format(header, directory, os.path.isabs(owner["file"]))
+        args = [file_arg if arg == owner["file"] else arg for arg in owner["arguments"]]
+        if owner["file"].lower().endswith(CXX_SOURCE_SUFFIXES) and header.lower().endswith(".h"):
+            # clang reads .h as C; a header owned by a C++ unit is C++.
+            args[1:1] = ["-x", "c++-header"]
+        return {
+            "command": " ".join(shell_quote(a) for a in args),
+            "arguments": args,
+            "directory": directory,
+            "file": file_arg,
+        }
+
+    def project_relpath(self, path, root):
+        # Forward slash path relative to the project, or None outside it (including on another drive).
+        try:
+            rel = os.path.relpath(path, root).replace("\\", "/")
+        except ValueError:
+            return None
+        return None if rel == ".." or rel.startswith("../") else rel
+
+    def vendor_prefix(self, path, root, patterns, is_file=False):
+        # The project relative path up to the first vendored directory, or None.
+        rel = self.project_relpath(path, root)
+        if rel is None:
+            return None
+        parts = rel.split("/")
+        for index, part in enumerate(parts[:-1] if is_file else parts):
+            lowered = part.lower()
+            if any(fnmatch.fnmatchcase(lowered, pattern.lower()) for pattern in patterns):
+                return "/".join(parts[:index + 1])
+        return None
+
+    def vendor_patterns(self):
+        return CLANGD_VENDOR_DIRS + tuple(self.config_manager.get("clangd", "vendor_dirs") or ())
+
+    def include_options(self, paths, directory=None):
+        # --clangd: the trailing toolchain, CMSIS, pack and vendored include dirs become -isystem. clang
+        # searches every -I dir before any -isystem dir, so a system dir followed by a project dir keeps
+        # -I: the search order stays exactly as the project lists it.
+        options = ["-I"] * len(paths)
+        if self.clangd:
+            index = len(paths)
+            while index and self.is_system_include(paths[index - 1], directory):
+                index -= 1
+                options[index] = "-isystem"
+        return options
+
+    def is_system_include(self, path, directory=None):
+        path = os.path.normpath(os.path.join(directory or str(self.project_root), path))
+        key = path_dedupe_key(path)
+        cached = self.system_includes.get(key)
+        if cached is None:
+            if self.system_roots is None:
+                self.system_roots = self.toolchain_include_roots()
+            cached = any(key == root or key.startswith(root.rstrip(os.sep) + os.sep) for root in self.system_roots)
+            if not cached:
+                cached = self.is_vendored(path, os.path.normpath(str(self.project_root)), self.vendor_patterns())
+            self.system_includes[key] = cached
+        return cached
+
+    def is_vendored(self, path, root, patterns):
+        # Like vendor_prefix, but also for dirs beside the project: CubeMX keeps MDK-ARM/ next to ../Drivers.
+        try:
+            rel = os.path.relpath(path, root).replace("\\", "/")
+        except ValueError:
+            rel = os.path.splitdrive(path)[1].replace("\\", "/")
+        return any(fnmatch.fnmatchcase(part.lower(), pattern.lower())
+                   for part in rel.split("/") if part not in ("", "..") for pattern in patterns)
+
+    def toolchain_include_roots(self):
+        # Install, CMSIS, compiler include and pack directories from config.json and the toolchain index.
+        roots = []
+        for section, names in (("keil", ("install_path", "cmsis_path", "armcc_include", "armclang_include")),
+                               ("iar", ("install_path", "cmsis_path", "c_include"))):
+            roots.extend(self.config_manager.get(section, name) for name in names)
+        keil_path = self.config_manager.get("keil", "install_path")
+        if keil_path:
+            roots.extend(str(path) for path in keil_pack_roots(keil_path))
+        return [path_dedupe_key(os.path.normpath(os.path.abspath(root))) for root in roots if root]
+
+    def clangd_root(self, entries):
+        # A .clangd only applies below its own directory, so it goes to the common root of the project and
+        # its sources: CubeMX keeps MDK-ARM/ next to ../Drivers. Never the filesystem root or a home dir.
+        root = os.path.normpath(str(self.project_root))
+        dirs = {root}
+        dirs.update(os.path.dirname(os.path.normpath(os.path.join(entry["directory"], entry["file"])))
+                    for entry in entries)
+        try:
+            common = os.path.commonpath(list(dirs))
+            home = os.path.normpath(str(Path.home()))
+            if os.path.dirname(common) == common or os.path.commonpath([common, home]) == common:
+                return root
+        except ValueError:
+            return root
+        return common
+
+    def clangd_config(self, entries, root=None):
+        # .clangd derived from the entries: vendored sources and the vendored directories searched for
+        # headers are kept out of the background index, and options clang does not understand are removed.
+        # Include dirs are classified as system headers in the entries themselves (include_option).
+        root = root or os.path.normpath(str(self.project_root))
+        patterns = self.vendor_patterns()
+        remove = OrderedDict()
+        skip = OrderedDict()
+        expanded = {}
+        checked_dirs = set()
+        checked = set()
+        for entry in entries:
+            directory = entry["directory"]
+            source = os.path.normpath(os.path.join(directory, entry["file"]))
+            prefix = self.vendor_prefix(source, root, patterns, True)
+            if prefix:
+                skip[prefix] = None
+            for path in entry_include_dirs(entry, expanded):
+                if path not in checked_dirs:
+                    checked_dirs.add(path)
+                    prefix = self.vendor_prefix(path, root, patterns)
+                    if prefix:
+                        skip[prefix] = None
+            for arg in entry_arguments(entry, expanded)[1:]:
+                if arg in checked:
+                    continue
+                checked.add(arg)
+                for pattern in CLANGD_UNSUPPORTED_FLAGS:
+                    if fnmatch.fnmatchcase(arg, pattern):
+                        remove[pattern] = None
+                        break
+
+        lines = [CLANGD_MARKER + " Delete this line to keep manual edits; it is overwritten otherwise."]
+        if remove:
+            lines.append("CompileFlags:")
+            lines.append("  Remove:")
+            lines.extend(f"    - {json.dumps(value, ensure_ascii=False)}" for value in remove)
+        if skip:
+            if len(lines) > 1:
+                lines.append("---")
+            lines.append("If:")
+            lines.append("  PathMatch:")
+            lines.extend(f"    - {json.dumps(clangd_path_regex(prefix), ensure_ascii=False)}" for prefix in skip)
+            lines.append("Index:")
+            lines.append("  Background: Skip")
+        return "\n".join(lines) + "\n"
+
+    def write_clangd(self, entries):
+        # A .clangd written by hand (without the marker line) is left alone.
+        if not self.clangd:
+            return None
+        root = self.clangd_root(entries)
+        output = Path(root) / ".clangd"
+        if not self.owns_clangd(output):
+            print(f"Warning: {output} was not generated by Keil2Json, leaving it unchanged")
+            return None
+        previous = self.project_root / ".clangd"
+        if previous != output and previous.is_file() and self.owns_clangd(previous):
+            # Written here by an earlier version; it would override the one above for the project's files.
+            previous.unlink()
+        with TIMINGS.phase("clangd"):
+            self.write_data(self.clangd_config(entries, root).encode("utf-8"), output)
+        print(f"  clangd config: {output}{self.write_note()}")
+        return output
+
+    @staticmethod
+    def owns_clangd(path):
+        # Missing, or carrying the marker line.
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                return f.readline().startswith(CLANGD_MARKER)
+        except OSError:
+            return True
+
+    def with_headers(self, entries):
+        return entries + self.header_entries(entries) if self.headers else entries
+
+    def target_profile(self, target):
+        # Driver and toolchain flags, computed once per distinct compiler/version/CPU and shared by all entries.
+        cpu = target.device.get("Cpu", "")
+        key = ("profile", target.compiler_type, target.compiler_version, cpu)
+        cached = self.option_sets.get(key)
+        if cached is None:
+            compiler, args = toolchain_profile(target.compiler_type, target.compiler_version, cpu)
+            cached = compiler, tuple(args)
+            self.option_sets[key] = cached
+        return cached
+
+    def flag_set(self, include_paths, defines, profile_args):
+        # Files sharing include paths and defines share one formatted flag list and its quoted command tail.
+        profile_args = list(profile_args)
+        key = (tuple(include_paths), tuple(defines), tuple(profile_args))
+        cached = self.flag_sets.get(key)
+        if cached is None:
+            include_paths = self.unique(include_paths)
+            include_paths = self.include_plans.get(tuple(include_paths), include_paths)
+            options = self.include_options(include_paths)
+            includes = [option + self.format_path(p) for option, p in zip(options, include_paths)]
+            base_args = profile_args + includes + [f"-D{d}" for d in self.unique(defines)]
+            if self.response_files and base_args:
+                cached = self.response_file_flags(base_args)
+            else:
+                cached = base_args, " ".join(shell_quote(a) for a in base_args)
+            self.flag_sets[key] = cached
+        if self.response_files and cached[0] and cached[0][0].startswith("@"):
+            self.write_response_file(cached[2])
+        return cached[:2]
+
+    def response_file_flags(self, base_args):
+        # --rsp: a flag set is written once to .keil2json/rsp/<hash>.rsp and every entry sharing it
+        # carries only @file. Identical flag sets of different targets share one file.
+        data = ("\n".join(response_file_quote(a) for a in base_args) + "\n").encode("utf-8")
+        path = self.rsp_dir() / f"{hashlib.sha1(data).hexdigest()[:16]}.rsp"
+        arg = "@" + self.format_path(path)
+        return [arg], shell_quote(arg), (path, data)
+
+    def write_response_file(self, record):
+        path, data = record
+        if path not in self.written_response_files:
+            with TIMINGS.phase("write"):
+                self.write_data(data, path)
+            self.written_response_files.add(path)
+
+    def rsp_dir(self):
+        return self.response_dir or self.project_root / STATE_DIR_NAME / "rsp"
+
+    def clean_response_files(self, keep, written=()):
+        # Response files no longer referenced by any database are removed. Besides the databases written
+        # in this run, per-target databases of earlier --all-targets runs left in .keil2json still count.
+        directory = self.rsp_dir()
+        keep = {path_dedupe_key(os.path.normpath(str(path))) for path in keep}
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return
+        stale = [directory / name for name in names
+                 if name.endswith(".rsp") and path_dedupe_key(os.path.normpath(str(directory / name))) not in keep]
+        if not stale:
+            return
+        written = {path_dedupe_key(os.path.normpath(str(path))) for path in written}
+        for database in directory.parent.glob("*/compile_commands.json"):
+            if path_dedupe_key(os.path.normpath(str(database))) in written:
+                continue
+            try:
+                with database.open("r", encoding="utf-8") as f:
+                    entries = json.load(f)
+                keep.update(path_dedupe_key(path) for entry in entries for path in entry_response_files(entry))
+            except (OSError, ValueError, KeyError, TypeError):
+                # An unreadable database cannot say what it needs; keep everything rather than guess.
+                return
+        for path in stale:
+            if path_dedupe_key(os.path.normpath(str(path))) in keep:
+                continue
+            self.written_response_files.discard(path)
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def format_make_arg_path(self, value, directory=None):
+        directory = directory or str(self.project_root)
+        if not os.path.isabs(value):
+            value = os.path.join(directory, value)
+        return self.format_path(value, directory)
+
+    def make_include_options(self, args, directory):
+        # Same -I scan as generate_make_entries. A command already using -isystem keeps its own split:
+        # adding more system dirs could reorder them against the existing ones.
+        values = []
+        index = 0
+        while index < len(args):
+            token = args[index]
+            index += 1
+            if self.is_source_file(token):
+                continue
+            if token == "-I" and index < len(args):
+                values.append(args[index])
+                index += 1
+            elif token.startswith("-I") and len(token) > 2:
+                values.append(token[2:])
+        if any(token.startswith("-isystem") for token in args):
+            return ["-I"] * len(values)
+        return self.include_options(values, directory)
 
     def generate_make_entries(self, compile_entries):
-        compile_dir = str(self.project_root).replace("\\", "/")
         entries = []
-        for compiler, source_file, args in compile_entries:
+        for compiler, source_file, args, directory in compile_entries:
+            # Relative paths are written relative to the directory make ran the command in.
+            compile_dir = directory.replace("\\", "/")
+            file_arg = self.format_path(source_file, directory)
             formatted = []
+            options = iter(self.make_include_options(args, directory))
             index = 0
             while index < len(args):
                 token = args[index]
                 if self.is_source_file(token):
-                    formatted.append(self.format_path(source_file))
+                    formatted.append(file_arg)
                     index += 1
                     continue
+                if self.clangd and token in CLANGD_UNSUPPORTED_VALUE_FLAGS and index + 1 < len(args):
+                    index += 2
+                    continue
                 if token == "-I" and index + 1 < len(args):
-                    formatted.extend(["-I", self.format_make_arg_path(args[index + 1])])
+                    value = args[index + 1]
+                    formatted.extend([next(options), self.format_make_arg_path(value, directory)])
                     index += 2
                     continue
                 if token.startswith("-I") and len(token) > 2:
-                    formatted.append("-I" + self.format_make_arg_path(token[2:]))
+                    value = token[2:]
+                    formatted.append(next(options) + self.format_make_arg_path(value, directory))
                     index += 1
                     continue
                 formatted.append(token)
                 index += 1
             command_args = [compiler] + formatted
             entries.append({
-                "command": " ".join(shlex.quote(a) for a in command_args),
+                "command": " ".join(shell_quote(a) for a in command_args),
                 "arguments": command_args,
                 "directory": compile_dir,
-                "file": self.format_path(source_file),
+                "file": file_arg,
             })
         return entries
 
-    def write_json(self, entries):
-        output = self.project_root / "compile_commands.json"
-        with output.open("w", encoding="utf-8") as f:
-            json.dump(entries, f, indent=4, ensure_ascii=False)
+    def make_entry(self, source, flags, compile_dir, compiler):
+        base_args, tail = flags
+        file_arg = self.format_path(source)
+        head = f"{shell_quote(compiler)} -c {shell_quote(file_arg)}"
+        return {
+            "command": f"{head} {tail}" if tail else head,
+            "arguments": [compiler, "-c", file_arg] + base_args,
+            "directory": compile_dir,
+            "file": file_arg,
+        }
+
+    def plan_includes(self, target, option_set, placeholder):
+        # Sources are grouped by their include dir list; each distinct list is analysed once against the
+        # sources using it, and flag_set() then formats the pruned order.
+        groups = OrderedDict()
+        for value in target.files:
+            source = self.resolve_project_path(self.project_root, value.replace(placeholder, ".") if placeholder else value)
+            if not source or source.lower().endswith((".s", ".asm")):
+                continue
+            options = target.file_options.get(value) or (target.include_paths, target.defines)
+            includes = tuple(self.unique(option_set(*options)[0]))
+            groups.setdefault(includes, []).append(os.path.normpath(source))
+        with TIMINGS.phase("prune includes"):
+            header_map = HeaderMap(self.project_root, self.project_root / STATE_DIR_NAME / "includes.json")
+            pruner = IncludePruner(header_map, self.prune_includes == "reorder")
+            pruner.check_dirs(os.path.normpath(path) for includes in groups for path in includes)
+            for includes, sources in groups.items():
+                # The analysis runs on native paths; flag_set() looks plans up by the resolved strings.
+                order = pruner.plan(tuple(os.path.normpath(path) for path in includes), sources)
+                self.include_plans[includes] = [path.replace("\\", "/") for path in order]
+            header_map.save()
+        saved = pruner.probes_before - pruner.probes_after
+        TIMINGS.count("include probes saved", saved)
+        total = len({path for includes in groups for path in includes})
+        print(f"  target '{target.name}': include dirs {total - len(pruner.dropped)} of {total} kept "
+              f"({len(pruner.dropped)} missing or empty), probes {pruner.probes_before} -> {pruner.probes_after} "
+              f"({saved} saved)")
+        if self.verbose:
+            for path in sorted(pruner.dropped):
+                print(f"    dropped  {self.format_path(path)}")
+            for path, count in sorted(pruner.usage.items(), key=lambda item: -item[1]):
+                print(f"    {count:7d}  {self.format_path(path)}")
+
+    def target_entries(self, summary, target, previous=None):
+        # Entries of one target. With a cache record from an earlier run, sources whose raw path and
+        # options are unchanged reuse their previous entry instead of being resolved and formatted again.
+        kind = summary.kind
+        if kind == "keil":
+            pack_options = self.device_pack_options(summary, target)
+
+            def option_set(include_paths, defines):
+                return self.keil_option_set(include_paths, defines, target.compiler_type, pack_options)
+            placeholder = None
+        else:
+            pack_options = None
+            option_set = self.iar_option_set
+            placeholder = "$PROJ_DIR$"
+        compiler, profile_args = self.target_profile(target)
+        if self.prune_includes:
+            # Pruning depends on what is on disk now, so nothing is reused and flags are formatted again.
+            previous = None
+            self.flag_sets.clear()
+            self.plan_includes(target, option_set, placeholder)
+
+        # Anything that changes how a path or flag is formatted invalidates the reusable entries.
+        key = fingerprint_key([
+            kind, target.compiler_type, target.include_paths, target.defines, pack_options,
+            str(self.project_root), self.absolute, compiler, profile_args, self.config_manager.config,
+            self.response_files, self.prune_includes, self.clangd,
+        ])
+        previous_entries = previous.get("entries", {}) if previous and previous.get("key") == key else {}
+        if previous_entries and not all(os.path.isfile(path) for path in previous.get("response_files", ())):
+            # Reused entries would point at a response file that is gone.
+            previous_entries = {}
+        compile_dir = str(self.project_root).replace("\\", "/")
+        default_flags = None
+        entries = []
+        cached = {}
+        seen = set()
+        reused = 0
+        for value in target.files:
+            options = target.file_options.get(value)
+            file_key = json.dumps([value, options], ensure_ascii=False)
+            entry = previous_entries.get(file_key)
+            if entry is not None:
+                reused += 1
+            else:
+                path = value.replace(placeholder, ".") if placeholder else value
+                source = self.resolve_project_path(self.project_root, path)
+                if not source:
+                    continue
+                if options is not None:
+                    flags = self.flag_set(*option_set(*options), profile_args)
+                else:
+                    if default_flags is None:
+                        default_flags = self.flag_set(*option_set(target.include_paths, target.defines), profile_args)
+                    flags = default_flags
+                entry = self.make_entry(source, flags, compile_dir, compiler)
+            dedupe = entry["file"].lower()
+            if dedupe in seen:
+                continue
+            seen.add(dedupe)
+            cached[file_key] = entry
+            entries.append(entry)
+        if previous_entries and self.verbose:
+            print(f"  target '{target.name}': reused {reused} of {len(entries)} cached entries")
+        response_files = sorted({path for entry in entries for path in entry_response_files(entry)})
+        return entries, {"key": key, "entries": cached, "response_files": response_files}
+
+    def cache_inputs(self, project_file):
+        inputs = [project_file, self.config_manager.path]
+        keil_path = self.config_manager.get("keil", "install_path")
+        if keil_path:
+            inputs.append(Path(keil_path) / "TOOLS.INI")
+        return inputs + [Path(path) for path in sorted(self.pack_files)]
+
+    def pack_listings(self):
+        # Installing a pack version or generating RTE/_<Target> changes these listings, not any input file.
+        listings = {}
+        for path in sorted(self.pack_dirs):
+            try:
+                listings[path] = sorted(os.listdir(path))
+            except OSError:
+                listings[path] = None
+        return listings
+
+    def restore_pack_inputs(self, cache):
+        # Pack state is only known after the project is read; the check before that uses the previous run's.
+        settings = cache.data.get("settings") or {}
+        self.pack_files.update(settings.get("pack_files") or ())
+        self.pack_dirs.update(settings.get("pack_dirs") or ())
+
+    def cache_settings(self, project_file):
+        return {
+            "version": TOOL_VERSION,
+            "project": str(project_file),
+            "absolute": self.absolute,
+            "target": self.target or "",
+            "all_targets": self.all_targets,
+            "profiles": fingerprint_key(TOOLCHAIN_PROFILES),
+            "format": self.output_format,
+            "fields": self.fields,
+            "headers": self.headers,
+            "response_files": self.response_files,
+            "clangd": self.clangd,
+            "prune_includes": self.prune_includes or "",
+            "pack_files": sorted(self.pack_files),
+            "pack_dirs": self.pack_listings(),
+        }
+
+    def serialize_entries(self, entries):
+        if self.fields != "both":
+            dropped = "command" if self.fields == "arguments" else "arguments"
+            entries = [{key: value for key, value in entry.items() if key != dropped} for entry in entries]
+        if self.output_format == "compact":
+            text = json.dumps(entries, ensure_ascii=False, separators=(",", ":"))
+        else:
+            text = json.dumps(entries, indent=4, ensure_ascii=False)
+        return text.encode("utf-8")
+
+    def write_json(self, entries, output=None):
+        # Unchanged content is never rewritten, and a changed database is swapped in with a rename so
+        # clangd never sees a half-written file.
+        output = output or self.project_root / "compile_commands.json"
+        with TIMINGS.phase("write"):
+            return self.write_data(self.serialize_entries(entries), output)
+
+    def write_data(self, data, output):
+        self.last_write_changed = True
+        try:
+            if output.stat().st_size == len(data):
+                with output.open("rb") as f:
+                    existing = hashlib.sha1(f.read()).digest()
+                if existing == hashlib.sha1(data).digest():
+                    self.last_write_changed = False
+                    return output
+        except OSError:
+            pass
+
+        output.parent.mkdir(parents=True, exist_ok=True)
+        temp = output.with_name(f".{output.name}.{os.getpid()}.tmp")
+        try:
+            with temp.open("wb") as f:
+                f.write(data)
+            os.replace(temp, output)
+            TIMINGS.count("bytes written", len(data))
+        finally:
+            if temp.exists():
+                temp.unlink()
         return output
 
+    def record_path_counters(self):
+        TIMINGS.count("paths resolved", self.paths.misses)
+        TIMINGS.count("dirs resolved", self.paths.dir_misses)
+        TIMINGS.count("path cache hits", self.paths.hits)
+
+    def write_note(self):
+        return "" if self.last_write_changed else ", unchanged"
+
     def detect_project(self):
         root = self.path.resolve()
         if root.is_file():
@@ -944,43 +3515,299 @@ class CompileCommandsGenerator:
             return root
 
         self.project_root = root
-        for pattern in ("**/*.uvprojx", "**/*.ewp"):
-            files = list(root.glob(pattern))
-            if files:
-                self.project_root = files[0].parent.resolve()
-                return files[0]
-        for name in ("Makefile", "makefile"):
-            makefile = root / name
-            if makefile.exists():
-                return makefile
+        makefile = None
+        for candidate in walk_project_files(root, self.max_depth, self.ignore):
+            if candidate.name in MAKEFILE_NAMES:
+                # A Makefile only counts at the root and only when no Keil/IAR project exists below.
+                if makefile is None and candidate.parent == root:
+                    makefile = candidate
+                continue
+            self.project_root = candidate.parent.resolve()
+            return candidate
+        if makefile:
+            return makefile
         raise FileNotFoundError("cannot find .uvprojx, .ewp, Makefile, or makefile")
 
+    def generate_from_log(self):
+        # Nothing is built: the project only anchors relative paths and locates Keil Objects directories.
+        try:
+            with TIMINGS.phase("discover"):
+                project_file = self.detect_project()
+        except FileNotFoundError:
+            project_file = None
+            self.project_root = self.path.resolve()
+        self.project_file = project_file
+        with TIMINGS.phase("read log"):
+            compile_entries = self.parse_build_log(project_file)
+        with TIMINGS.phase("entries"):
+            entries = self.generate_make_entries(compile_entries)
+        entries = self.with_headers(entries)
+        output = self.write_json(entries)
+        style = "absolute" if self.absolute else "relative"
+        print(f"generate complete: {output} ({style} path, {len(entries)} files{self.write_note()})")
+        self.write_clangd(entries)
+
+    def project_entries(self, project_file):
+        # Entries of one project's selected target without writing anything. A -t name missing from this
+        # project means it belongs to another workspace project, so the default target is used.
+        self.project_file = project_file
+        if project_file.suffix.lower() in {".uvprojx", ".ewp"}:
+            summary = self.read_project(project_file)
+            target = self.target if self.target and summary.target(self.target) else None
+            with TIMINGS.phase("entries"):
+                entries = self.target_entries(summary, self.project_target(summary, target))[0]
+        else:
+            compile_entries = self.parse_makefile()
+            with TIMINGS.phase("entries"):
+                entries = self.generate_make_entries(compile_entries)
+        return self.with_headers(entries)
+
+    def workspace_options(self):
+        # Makefiles found in a tree include vendored SDK and example builds: they are only captured with
+        # make -n -B, never cleaned or built.
+        return {
+            "absolute": self.absolute,
+            "config_manager": self.config_manager,
+            "dry_run": True,
+            "stream": self.stream,
+            "target": self.target,
+            "make_clean": False,
+            "headers": self.headers,
+            "response_files": self.response_files,
+            "prune_includes": self.prune_includes,
+            "clangd": self.clangd,
+            "response_dir": self.path.resolve() / STATE_DIR_NAME / "rsp" if self.response_files else None,
+        }
+
+    def generate_workspace(self):
+        # Every project under the tree, generated in worker processes (XML parsing and path resolution are
+        # CPU and syscall bound) and merged in discovery order into one root compile_commands.json.
+        root = self.path.resolve()
+        self.project_root = root
+        with TIMINGS.phase("discover"):
+            projects = find_workspace_projects(root, self.max_depth, self.ignore)
+        if not projects:
+            raise FileNotFoundError("cannot find .uvprojx, .ewp, Makefile, or makefile")
+        print(f"Workspace: {len(projects)} projects under {root}")
+
+        start = time.perf_counter()
+        options = self.workspace_options()
+        parallel = len(projects) > 1
+        if not parallel:
+            results = [workspace_project_entries(projects[0], options)]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+
+            workers = min(len(projects), os.cpu_count() or 1)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(workspace_project_entries, projects, [options] * len(projects)))
+
+        entries = []
+        seen = set()
+        failed = 0
+        for project, (project_entries, elapsed, error, timings) in zip(projects, results):
+            if parallel:
+                # Worker process phases sum across projects that ran in parallel.
+                TIMINGS.merge(timings)
+            added = 0
+            for entry in project_entries:
+                # A source shared by several projects keeps the entry of the first project found.
+                key = path_dedupe_key(os.path.normpath(os.path.join(entry["directory"], entry["file"])))
+                if key in seen:
+                    continue
+                seen.add(key)
+                entries.append(entry)
+                added += 1
+            label = project.relative_to(root).as_posix()
+            if error:
+                failed += 1
+                print(f"  {elapsed * 1000:9.1f} ms  failed       {label}: {error}")
+            else:
+                shared = len(project_entries) - added
+                note = f" ({shared} shared)" if shared else ""
+                print(f"  {elapsed * 1000:9.1f} ms  {added:6d} files  {label}{note}")
+
+        if not entries:
+            raise RuntimeError("no compile commands generated for any workspace project")
+        output = self.write_json(entries)
+        if self.response_files:
+            self.clean_response_files({path for entry in entries for path in entry_response_files(entry)}, [output])
+        style = "absolute" if self.absolute else "relative"
+        elapsed = time.perf_counter() - start
+        failures = f", {failed} failed" if failed else ""
+        print(f"generate complete: {output} ({style} path, {len(entries)} files from {len(projects)} projects"
+              f"{failures}{self.write_note()}, {elapsed * 1000:.1f} ms)")
+        self.write_clangd(entries)
+
     def generate(self):
-        project_file = self.detect_project()
+        if self.workspace:
+            self.generate_workspace()
+            return
+        if self.from_log:
+            self.generate_from_log()
+            if self.verbose:
+                print(self.paths.summary())
+            return
+
+        with TIMINGS.phase("discover"):
+            project_file = self.detect_project()
+        self.project_file = project_file
         suffix = project_file.suffix.lower()
         name = project_file.name.lower()
 
-        if suffix == ".uvprojx":
-            compiler_type = detect_keil_compiler_type(project_file)
-            print(f"Detected Keil project, compiler: {compiler_type}")
-            includes, defines, sources = self.parse_uvprojx(project_file)
-            entries = self.generate_entries(includes, defines, sources)
-        elif suffix == ".ewp":
-            print("Detected IAR EWARM project")
-            includes, defines, sources = self.parse_ewp(project_file)
-            entries = self.generate_entries(includes, defines, sources)
+        style = "absolute" if self.absolute else "relative"
+        if suffix in {".uvprojx", ".ewp"}:
+            cache = GenerationCache(self.project_root / STATE_DIR_NAME / "cache.json") if self.use_cache else None
+            if cache:
+                self.restore_pack_inputs(cache)
+            settings = self.cache_settings(project_file)
+            with TIMINGS.phase("cache check"):
+                inputs = cache.fingerprint_inputs(self.cache_inputs(project_file)) if cache else {}
+                # Header owners and include pruning depend on source contents, which the cache does not track.
+                fresh = cache and not self.headers and not self.prune_includes and cache.is_fresh(inputs, settings)
+                if fresh:
+                    cache.refresh_inputs(inputs)
+            if fresh:
+                print(f"compile_commands.json is up to date: {self.project_root / 'compile_commands.json'}")
+                return
+
+            summary = self.read_project(project_file)
+            targets = self.select_targets(summary)
+            if suffix == ".uvprojx":
+                print(f"Detected Keil project, compiler: {targets[0].compiler_type}")
+            else:
+                print("Detected IAR EWARM project")
+            outputs = []
+            records = {}
+            response_files = set()
+            for index, target in enumerate(targets):
+                previous = cache.target_record(target.name) if cache else None
+                with TIMINGS.phase("entries"):
+                    entries, records[target.name] = self.target_entries(summary, target, previous)
+                entries = self.with_headers(entries)
+                response_files.update(path for entry in entries for path in entry_response_files(entry))
+                if index == 0:
+                    output = self.write_json(entries)
+                    outputs.append(output)
+                    label = f", target '{target.name}'" if target.name else ""
+                    print(f"generate complete: {output} ({style} path, {len(entries)} files{label}{self.write_note()})")
+                    clangd = self.write_clangd(entries)
+                    if clangd:
+                        outputs.append(clangd)
+                if self.all_targets:
+                    output = self.write_json(entries, self.target_output(target, targets))
+                    outputs.append(output)
+                    print(f"  target '{target.name}': {output} ({len(entries)} files{self.write_note()})")
+            self.clean_response_files(response_files, outputs)
+            if response_files:
+                print(f"  response files: {len(response_files)} in {self.rsp_dir()}")
+            outputs.extend(sorted(response_files))
+            if cache:
+                with TIMINGS.phase("cache save"):
+                    # Packs are only known once targets resolved; key the cache on the ones this run read.
+                    settings = self.cache_settings(project_file)
+                    inputs = cache.fingerprint_inputs(self.cache_inputs(project_file))
+                    cache.save(inputs, settings, records, outputs)
         elif name in {"makefile"}:
             print("Detected Makefile project")
-            entries = self.generate_make_entries(self.parse_makefile())
+            compile_entries = self.parse_makefile()
+            with TIMINGS.phase("entries"):
+                entries = self.generate_make_entries(compile_entries)
+            entries = self.with_headers(entries)
+            output = self.write_json(entries)
+            print(f"generate complete: {output} ({style} path, {len(entries)} files{self.write_note()})")
+            self.write_clangd(entries)
         else:
             raise ValueError(f"unsupported project file: {project_file}")
 
-        output = self.write_json(entries)
-        style = "absolute" if self.absolute else "relative"
-        print(f"generate complete: {output} ({style} path, {len(entries)} files)")
+        if self.verbose:
+            print(f"XML parses: {ProjectDocument.parse_count}")
+            print(self.paths.summary())
+
+
+class ProjectWatcher:
+    # --watch: one generator stays alive between regenerations, so parsed projects, resolved paths, option
+    # sets and toolchain lookups survive. Its inputs are polled and a burst of saves regenerates only once.
+    def __init__(self, generator, interval=0.5, debounce=0.3):
+        self.generator = generator
+        self.interval = interval
+        self.debounce = debounce
+
+    def inputs(self):
+        generator = self.generator
+        if generator.project_file:
+            # A pack directory's mtime moves when versions or RTE files are added or removed.
+            paths = generator.cache_inputs(generator.project_file) + sorted(generator.pack_dirs)
+        else:
+            paths = [generator.config_manager.path]
+        if generator.from_log:
+            paths.append(Path(generator.from_log).expanduser())
+        return paths
+
+    @staticmethod
+    def snapshot(paths):
+        state = {}
+        for path in paths:
+            try:
+                stat = Path(path).stat()
+                state[str(path)] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                state[str(path)] = None
+        return state
+
+    def regenerate(self, changed):
+        generator = self.generator
+        start = time.perf_counter()
+        config_changed = str(generator.config_manager.path) in changed
+        if config_changed:
+            generator.config_manager.config = generator.config_manager.load()
+        if config_changed or any(path in generator.pack_files or path in generator.pack_dirs for path in changed):
+            # Option and flag sets are keyed by project values only; the config paths and resolved device
+            # packs they embed moved.
+            generator.option_sets.clear()
+            generator.flag_sets.clear()
+        try:
+            generator.generate()
+        except (OSError, RuntimeError, ValueError, SyntaxError) as exc:
+            # SyntaxError covers ElementTree's ParseError for a project file caught mid-save.
+            print(f"Error: {exc}")
+        elapsed = (time.perf_counter() - start) * 1000
+        names = ", ".join(Path(path).name for path in changed) if changed else "initial run"
+        print(f"[{time.strftime('%H:%M:%S')}] regenerated in {elapsed:.1f} ms ({names})")
+
+    def run(self):
+        self.regenerate([])
+        if self.generator.project_file:
+            # Discovery already happened; later runs go straight to the project file.
+            self.generator.path = Path(self.generator.project_file)
+        state = self.snapshot(self.inputs())
+        print(f"Watching {len(state)} files, press Ctrl+C to stop")
+        pending = set()
+        last_change = 0.0
+        try:
+            while True:
+                time.sleep(self.interval)
+                current = self.snapshot(self.inputs())
+                changed = {path for path in set(state) | set(current) if state.get(path) != current.get(path)}
+                state = current
+                if changed:
+                    pending |= changed
+                    last_change = time.monotonic()
+                elif pending and time.monotonic() - last_change >= self.debounce:
+                    self.regenerate(sorted(pending))
+                    pending = set()
+                    state = self.snapshot(self.inputs())
+        except KeyboardInterrupt:
+            print("Watch stopped")
 
 
 def main():
+    if getattr(sys, "frozen", False):
+        # The PyInstaller exe must let --workspace worker processes start; their --multiprocessing-fork
+        # arguments are not ours, so this has to run before argparse sees them.
+        import multiprocessing
+        multiprocessing.freeze_support()
+
     parser = argparse.ArgumentParser(
         description="Generate compile_commands.json for Keil MDK, IAR EWARM, and Makefile projects"
     )
@@ -989,6 +3816,32 @@ def main():
     parser.add_argument("--setup", "-s", action="store_true", help="Run setup wizard and save config")
     parser.add_argument("--show-config", action="store_true", help="Print saved config and exit")
     parser.add_argument("--dry-run", "-n", action="store_true", help="For Makefile projects use make -n after make clean")
+    parser.add_argument("--no-clean", action="store_true",
+                        help="For Makefile projects skip make clean, capture with make -n -B and build in the background")
+    parser.add_argument("--make_dirs", nargs="+", metavar="DIR",
+                        help="Capture make -n separately and in parallel in each of these directories ('.' for the root)")
+    parser.add_argument("--make_jobs", type=int, help="make -j value passed to the real Makefile build")
+    parser.add_argument("--workspace", action="store_true",
+                        help="Generate for every .uvprojx/.ewp/Makefile project under --path in parallel and merge "
+                             "them into one compile_commands.json")
+    parser.add_argument("--from-log", metavar="FILE",
+                        help="Generate from a saved make / iarbuild / Keil UV4 build log, or a Keil Objects directory "
+                             "with .dep/.__i files, without building")
+    parser.add_argument("--headers", action="store_true",
+                        help="Also write entries for project headers, with the flags of the source that includes them")
+    parser.add_argument("--rsp", action="store_true",
+                        help="Keil/IAR: write each shared flag set once to .keil2json/rsp/<hash>.rsp and reference it "
+                             "with @file from the entries")
+    parser.add_argument("--clangd", action="store_true",
+                        help="Also write a .clangd skipping vendored code in the background index and removing flags "
+                             "clang rejects; trailing toolchain and vendored include dirs become -isystem. It goes "
+                             "to the common root of the project and its sources, e.g. above CubeMX's MDK-ARM/")
+    parser.add_argument("--prune-includes", nargs="?", const="prune", choices=["prune", "reorder"],
+                        help="Keil/IAR: drop missing or empty include dirs; reorder also moves the most used dirs "
+                             "first without changing which header any #include resolves to")
+    parser.add_argument("--max-depth", type=int, help="Maximum directory depth searched for project files; -1 for unlimited")
+    parser.add_argument("--ignore", action="append", default=[], metavar="GLOB",
+                        help="Directory name or relative path glob skipped during project discovery; repeatable")
     parser.add_argument("--keil_build", action="store_true", help="Run Keil UV4 command instead of generating compile_commands.json")
     parser.add_argument(
         "--keil_action",
@@ -996,17 +3849,66 @@ def main():
         default="build",
         help="Keil UV4 action used with --keil_build",
     )
-    parser.add_argument("--target", "-t", help="Keil target name used with --keil_build")
+    parser.add_argument("--target", "-t", help="Keil target / IAR configuration to generate for or build with --keil_build")
+    parser.add_argument("--all-targets", action="store_true",
+                        help="Also write .keil2json/<target>/compile_commands.json for every target or configuration")
     parser.add_argument("--list-targets", action="store_true", help="List Keil targets and exit")
     parser.add_argument("--keil_uv4", help="Override UV4.exe path")
     parser.add_argument("--keil_jobs", type=int, help="Keil UV4 -j value used when hiding the Keil window; debug never uses -j")
     parser.add_argument("--keil_log", help="Keil UV4 output log path")
     parser.add_argument("--keil_window", action="store_true", help="Show Keil window while running UV4; debug always shows the window")
+    parser.add_argument("--format", choices=["pretty", "compact"], default="pretty",
+                        help="compile_commands.json layout; compact drops indentation")
+    parser.add_argument("--fields", choices=["both", "arguments", "command"], default="both",
+                        help="Write the arguments list, the command string, or both for every entry")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Ignore and do not update .keil2json/cache.json; always regenerate")
+    parser.add_argument("--stream", action="store_true",
+                        help="Read .uvprojx/.ewp with the streaming parser regardless of file size")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and regenerate when the project file, config.json or TOOLS.INI changes")
+    parser.add_argument("--watch-interval", type=float, default=0.5, metavar="SECONDS",
+                        help="Polling interval used by --watch")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Print parse counters after the run")
+    parser.add_argument("--timings", nargs="?", const="table", choices=["table", "json"],
+                        help="Print phase timings and counters after the run as a table (default) or JSON")
+    parser.add_argument("--profile", nargs="?", const="keil2json.prof", metavar="FILE",
+                        help="Run under cProfile, write the stats to FILE (default keil2json.prof) and print the top entries")
     args = parser.parse_args()
-
+    if args.workspace and (args.watch or args.from_log or args.all_targets):
+        parser.error("--workspace cannot be combined with --watch, --from-log or --all-targets")
+    profiler = None
+    if args.profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+    TIMINGS.reset()
+    try:
+        run(args)
+    except (OSError, RuntimeError, ValueError, SyntaxError) as exc:
+        # Bad paths, unknown targets and unreadable projects end the run with one line, not a traceback.
+        print(f"Error: {exc}")
+        raise SystemExit(1)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            import pstats
+
+            print(f"Profile written: {Path(args.profile).resolve()}")
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+        if args.timings == "json":
+            print(json.dumps(TIMINGS.as_dict(), indent=4))
+        elif args.timings:
+            print(TIMINGS.table())
+
+
+def run(args):
     manager = ConfigManager()
     if args.show_config:
         print(f"Config file: {manager.path}")
+        print(f"Toolchain index: {toolchain_index_path()}")
         print(json.dumps(manager.config, indent=4, ensure_ascii=False))
         return
 
@@ -1026,6 +3928,7 @@ def main():
             log_path=args.keil_log,
             config_manager=manager,
             list_targets=args.list_targets,
+            verbose=args.verbose,
         )
         raise SystemExit(exit_code)
 
@@ -1034,8 +3937,32 @@ def main():
         absolute=args.absolute,
         config_manager=manager,
         dry_run=args.dry_run,
+        max_depth=args.max_depth,
+        ignore=args.ignore,
+        verbose=args.verbose,
+        stream=args.stream,
+        target=args.target,
+        all_targets=args.all_targets,
+        use_cache=not args.no_cache,
+        output_format=args.format,
+        fields=args.fields,
+        make_clean=not args.no_clean,
+        make_jobs=args.make_jobs,
+        make_dirs=args.make_dirs,
+        from_log=args.from_log,
+        workspace=args.workspace,
+        headers=args.headers,
+        response_files=args.rsp,
+        clangd=args.clangd,
+        prune_includes=args.prune_includes,
     )
-    generator.generate()
+    try:
+        if args.watch:
+            ProjectWatcher(generator, interval=max(args.watch_interval, 0.05)).run()
+            return
+        generator.generate()
+    finally:
+        generator.record_path_counters()
 
 
 if __name__ == "__main__":
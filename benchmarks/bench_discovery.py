@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from Keil2Json import TIMINGS, CompileCommandsGenerator, ConfigManager  # noqa: E402
+from synthetic import build_tree  # noqa: E402
+
+
+def glob_detect(root):
+    for pattern in ("**/*.uvprojx", "**/*.ewp"):
+        files = list(root.glob(pattern))
+        if files:
+            return files[0]
+    return None
+
+
+def measure(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare project discovery on a synthetic tree")
+    parser.add_argument("--files", type=int, default=200000, help="Number of files in the synthetic tree")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--keep", help="Build the tree in this directory and keep it")
+    args = parser.parse_args()
+
+    base = Path(args.keep) if args.keep else Path(tempfile.mkdtemp(prefix="keil2json-walk-"))
+    try:
+        start = time.perf_counter()
+        expected = build_tree(base, args.files)
+        print(f"tree: {base} ({args.files} files, built in {time.perf_counter() - start:.2f}s)")
+
+        manager = ConfigManager()
+        generator = CompileCommandsGenerator(path=base, config_manager=manager)
+        glob_time, glob_result = measure(lambda: glob_detect(base), args.repeat)
+        before = TIMINGS.snapshot()
+        walk_time, walk_result = measure(generator.detect_project, args.repeat)
+        walked = TIMINGS.since(before)["counters"]
+        assert glob_result == expected, glob_result
+        assert walk_result == expected, walk_result
+        print(f"glob x2:      {glob_time * 1000:9.1f} ms")
+        print(f"scandir walk: {walk_time * 1000:9.1f} ms  ({walked['dirs walked'] // args.repeat} dirs, "
+              f"{walked['entries walked'] // args.repeat} entries listed)")
+        print(f"speedup:      {glob_time / walk_time:9.1f}x")
+    finally:
+        if not args.keep:
+            shutil.rmtree(base, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from Keil2Json import CompileCommandsGenerator, ConfigManager, split_command_line  # noqa: E402
+from synthetic import write_uvprojx  # noqa: E402
+
+
+def generate(project, response_files):
+    generator = CompileCommandsGenerator(path=project, config_manager=ConfigManager(), use_cache=False,
+                                         response_files=response_files)
+    generator.generate()
+    return project.parent / "compile_commands.json"
+
+
+def load(database, expand):
+    # What a consumer does at startup: parse the database, then (with --rsp) read and tokenize every
+    # response file an entry references.
+    with database.open("r", encoding="utf-8") as f:
+        entries = json.load(f)
+    if expand:
+        for entry in entries:
+            arguments = []
+            for arg in entry["arguments"]:
+                if arg.startswith("@"):
+                    with open(os.path.join(entry["directory"], arg[1:]), "r", encoding="utf-8") as f:
+                        arguments.extend(split_command_line(f.read().replace("\n", " ")))
+                else:
+                    arguments.append(arg)
+            entry["arguments"] = arguments
+    return entries
+
+
+def measure(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare compile_commands.json size and load time with and without --rsp")
+    parser.add_argument("--groups", type=int, default=30)
+    parser.add_argument("--files", type=int, default=100, help="Files per group")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    base = Path(tempfile.mkdtemp(prefix="keil2json-rsp-"))
+    try:
+        project = base / "demo.uvprojx"
+        write_uvprojx(project, args.groups, args.files, targets=1)
+        results = {}
+        for name, response_files in (("inline", False), ("rsp", True)):
+            database = base / f"{name}.json"
+            generate(project, response_files).replace(database)
+            rsp_dir = base / ".keil2json" / "rsp"
+            rsp_size = sum(p.stat().st_size for p in rsp_dir.glob("*.rsp")) if rsp_dir.is_dir() else 0
+            load_time, _ = measure(lambda: load(database, False), args.repeat)
+            expand_time, expanded = measure(lambda: load(database, True), args.repeat)
+            results[name] = (database.stat().st_size, rsp_size, load_time, expand_time,
+                             [entry["arguments"] for entry in expanded])
+
+        inline, rsp = results["inline"], results["rsp"]
+        assert inline[4] == rsp[4], "expanded --rsp entries differ from inline entries"
+        print(f"{len(inline[4])} entries, expanded arguments identical")
+        for name, (size, rsp_size, load_time, expand_time, _) in results.items():
+            print(f"{name:7s} {size / 1024:9.1f} KiB (+{rsp_size / 1024:6.1f} KiB rsp)  "
+                  f"json.load {load_time * 1000:8.1f} ms  with @file expansion {expand_time * 1000:8.1f} ms")
+        print(f"size: {inline[0] / (rsp[0] + rsp[1]):.1f}x smaller, load: {inline[2] / rsp[2]:.1f}x faster")
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import shlex
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from Keil2Json import CompileCommandsGenerator  # noqa: E402
+from synthetic import synthetic_log  # noqa: E402
+
+
+def shell_split(line):
+    try:
+        return shlex.split(line, posix=True)
+    except ValueError:
+        return []
+
+
+def legacy_parse(generator, line):
+    return generator.compile_command_from_tokens(shell_split(line))
+
+
+def measure(func, lines, repeat):
+    best = None
+    results = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [func(line) for line in lines]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare shlex and the fast-path tokenizer on make output")
+    parser.add_argument("--lines", type=int, default=500000, help="Synthetic log size")
+    parser.add_argument("--log", help="Use a recorded make -n / build log instead of a synthetic one")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.log:
+        lines = Path(args.log).read_text(encoding="utf-8", errors="replace").splitlines()
+    else:
+        lines = synthetic_log(args.lines)
+
+    generator = CompileCommandsGenerator(path=Path.cwd())
+    shlex_time, shlex_results = measure(lambda line: legacy_parse(generator, line), lines, args.repeat)
+    fast_time, fast_results = measure(generator.parse_compile_command, lines, args.repeat)
+    assert shlex_results == fast_results, "fast tokenizer output differs from shlex"
+    compiles = sum(1 for result in fast_results if result)
+    print(f"log: {len(lines)} lines, {compiles} compile commands, outputs identical")
+    print(f"shlex: {shlex_time * 1000:9.1f} ms  {len(lines) / shlex_time:12.0f} lines/s")
+    print(f"fast:  {fast_time * 1000:9.1f} ms  {len(lines) / fast_time:12.0f} lines/s")
+    print(f"speedup: {shlex_time / fast_time:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
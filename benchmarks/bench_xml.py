@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from Keil2Json import ProjectDocument, StreamingProjectReader  # noqa: E402
+from synthetic import write_ewp, write_uvprojx  # noqa: E402
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def dom_summary(path):
+    ProjectDocument._cache.clear()
+    return ProjectDocument.open(path).summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare DOM and streaming .uvprojx/.ewp readers")
+    parser.add_argument("--groups", type=int, default=200)
+    parser.add_argument("--files", type=int, default=100, help="Files per group")
+    parser.add_argument("--targets", type=int, default=4)
+    args = parser.parse_args()
+
+    base = Path(tempfile.mkdtemp(prefix="keil2json-xml-"))
+    try:
+        for name, writer in (("demo.uvprojx", write_uvprojx), ("demo.ewp", write_ewp)):
+            path = base / name
+            writer(path, args.groups, args.files, args.targets)
+            size = path.stat().st_size / (1024 * 1024)
+            dom_time, dom_peak, dom_result = measure(lambda: dom_summary(path))
+            stream_time, stream_peak, stream_result = measure(lambda: StreamingProjectReader(path).read())
+            assert dom_result == stream_result, f"{name}: streaming reader output differs from DOM reader"
+            files = sum(len(t.files) for t in dom_result.targets)
+            print(f"{name} ({size:.1f} MiB, {len(dom_result.targets)} targets, {files} files): outputs identical")
+            print(f"  dom:    {dom_time * 1000:9.1f} ms  peak {dom_peak / 1024 / 1024:8.1f} MiB")
+            print(f"  stream: {stream_time * 1000:9.1f} ms  peak {stream_peak / 1024 / 1024:8.1f} MiB")
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
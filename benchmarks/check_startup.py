@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from synthetic import write_config, write_uvprojx  # noqa: E402
+
+SCRIPT = ROOT / "Keil2Json.py"
+# Modules only the build/make/setup paths need; none of the measured modes may load them.
+HEAVY_MODULES = ("subprocess", "shlex", "configparser", "concurrent.futures", "queue", "threading", "winreg")
+XML_MODULES = ("xml.etree.ElementTree", "pyexpat")
+
+
+def import_times(stderr):
+    # "import time: self [us] | cumulative | imported package" lines written by -X importtime.
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) == 3:
+            modules[parts[2].strip()] = int(parts[0])
+    return modules
+
+
+def run(args, env, cwd, importtime):
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + args
+    start = time.perf_counter()
+    result = subprocess.run(command, env=env, cwd=cwd, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{result.stdout}\n{result.stderr}")
+    return elapsed, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check Keil2Json startup imports and time against a budget")
+    parser.add_argument("--budget-ms", type=float, default=40.0,
+                        help="Maximum total -X importtime self time of a mode, in milliseconds")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per mode for the wall time")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    base = Path(tempfile.mkdtemp(prefix="keil2json-startup-"))
+    try:
+        env = dict(os.environ, PYTHONDONTWRITEBYTECODE="", **write_config(base))
+        project = base / "project"
+        project.mkdir()
+        write_uvprojx(project / "demo.uvprojx", groups=10, files=20, targets=2)
+        # Warm runs: the first writes compile_commands.json and the cache; a script run as __main__ is never
+        # cached as bytecode, so the import compiles Keil2Json.py once before anything is measured.
+        run([str(SCRIPT), "-p", str(project)], env, str(base), False)
+        run(["-c", "import Keil2Json"], env, str(ROOT), False)
+
+        modes = [
+            ("import", ["-c", "import Keil2Json"], ()),
+            ("show-config", [str(SCRIPT), "--show-config"], ()),
+            ("list-targets", [str(SCRIPT), "-p", str(project), "--list-targets"], XML_MODULES),
+            ("cache-hit", [str(SCRIPT), "-p", str(project)], ()),
+        ]
+        failures = []
+        results = {}
+        for name, mode_args, allowed in modes:
+            _, result = run(mode_args, env, str(ROOT), True)
+            modules = import_times(result.stderr)
+            total_ms = sum(modules.values()) / 1000
+            wall = min(run(mode_args, env, str(ROOT), False)[0] for _ in range(args.repeat))
+            forbidden = HEAVY_MODULES + tuple(m for m in XML_MODULES if m not in allowed)
+            loaded = sorted(m for m in forbidden if m in modules)
+            results[name] = {"import_ms": round(total_ms, 2), "wall_ms": round(wall * 1000, 2), "loaded": loaded}
+            status = "ok"
+            if loaded:
+                status = "FAIL"
+                failures.append(f"{name}: loads {', '.join(loaded)}")
+            if total_ms > args.budget_ms:
+                status = "FAIL"
+                failures.append(f"{name}: imports take {total_ms:.1f} ms, budget {args.budget_ms:.1f} ms")
+            print(f"{name:13s} imports {total_ms:7.1f} ms  wall {wall * 1000:7.1f} ms  {status}")
+
+        if args.json:
+            Path(args.json).write_text(json.dumps(results, indent=4), encoding="utf-8")
+        for failure in failures:
+            print(f"FAIL {failure}")
+        raise SystemExit(1 if failures else 0)
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
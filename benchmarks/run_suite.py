@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Runs every generation phase against synthetic Keil, IAR and Makefile projects at several scales and
+# writes the timings as JSON, so results of two releases can be compared with --compare.
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import Keil2Json  # noqa: E402
+from Keil2Json import CompileCommandsGenerator, ConfigManager, ProjectDocument, StreamingProjectReader  # noqa: E402
+from synthetic import build_tree, synthetic_log, write_config, write_ewp, write_make_project, write_uvprojx  # noqa: E402
+
+RESULTS_VERSION = 1
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+# groups x files per group for project files, files in the discovery tree, lines of make output.
+SCALES = {
+    "small": {"groups": 10, "files": 50, "tree": 20000, "log": 20000},
+    "medium": {"groups": 50, "files": 100, "tree": 100000, "log": 200000},
+    "large": {"groups": 200, "files": 100, "tree": 400000, "log": 1000000},
+}
+
+
+def measure(func, repeat, setup=None):
+    best = None
+    result = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def generator(path, **options):
+    return CompileCommandsGenerator(path=path, config_manager=ConfigManager(), use_cache=False, **options)
+
+
+def bench_discovery(base, scale, repeat):
+    # Items are the directory entries the walker listed (a pruned dir is one entry), not the files created.
+    expected = build_tree(base / "tree", scale["tree"])
+    before = Keil2Json.TIMINGS.snapshot()
+    seconds, found = measure(lambda: generator(base / "tree").detect_project(), repeat)
+    counters = Keil2Json.TIMINGS.since(before)["counters"]
+    assert found == expected, found
+    return seconds, counters["entries walked"] // repeat, {"dirs": counters["dirs walked"] // repeat,
+                                                           "files": scale["tree"]}
+
+
+def bench_xml(base, scale, repeat):
+    results = {}
+    for name, writer in (("uvprojx", write_uvprojx), ("ewp", write_ewp)):
+        path = base / f"demo.{name}"
+        writer(path, scale["groups"], scale["files"], 4)
+        dom, dom_summary = measure(lambda: ProjectDocument.open(path).summary(), repeat, ProjectDocument._cache.clear)
+        stream, stream_summary = measure(lambda: StreamingProjectReader(path).read(), repeat)
+        assert dom_summary == stream_summary, f"{name}: streaming reader output differs from DOM reader"
+        files = sum(len(t.files) for t in dom_summary.targets)
+        results[f"xml_dom_{name}"] = (dom, files, {"bytes": path.stat().st_size})
+        results[f"xml_stream_{name}"] = (stream, files, {"bytes": path.stat().st_size})
+    return results
+
+
+def bench_entries(base, scale, repeat):
+    # Path resolution and flag formatting of one Keil target, with a fresh path cache every run.
+    path = base / "entries" / "demo.uvprojx"
+    path.parent.mkdir()
+    write_uvprojx(path, scale["groups"], scale["files"], 1)
+
+    def run():
+        gen = generator(path)
+        gen.detect_project()
+        summary = gen.read_project(path)
+        return gen.target_entries(summary, summary.targets[0])[0]
+    seconds, entries = measure(run, repeat)
+    return seconds, len(entries), {}
+
+
+def bench_tokenize(base, scale, repeat):
+    lines = synthetic_log(scale["log"])
+    gen = generator(base)
+    seconds, results = measure(lambda: [gen.parse_compile_command(line) for line in lines], repeat)
+    return seconds, len(lines), {"compiles": sum(1 for result in results if result)}
+
+
+def bench_make(base, scale, repeat):
+    # make clean + make -n through the fake make, streaming and parsing its output.
+    project = base / "make"
+    env = write_make_project(project, scale["log"])
+    saved = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    try:
+        def run():
+            gen = generator(project, dry_run=True)
+            gen.detect_project()
+            return gen.generate_make_entries(gen.parse_makefile())
+        seconds, entries = measure(run, repeat)
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+    return seconds, scale["log"], {"entries": len(entries)}
+
+
+def bench_write(base, scale, repeat):
+    path = base / "write" / "demo.uvprojx"
+    path.parent.mkdir()
+    write_uvprojx(path, scale["groups"], scale["files"], 1)
+    results = {}
+    for output_format in ("pretty", "compact"):
+        gen = generator(path, output_format=output_format)
+        gen.detect_project()
+        summary = gen.read_project(path)
+        entries = gen.target_entries(summary, summary.targets[0])[0]
+        output = path.parent / f"{output_format}.json"
+
+        def run():
+            # A missing file forces the serialize + atomic replace path instead of the unchanged shortcut.
+            output.unlink(missing_ok=True)
+            return gen.write_json(entries, output)
+        seconds, _ = measure(run, repeat)
+        results[f"write_{output_format}"] = (seconds, len(entries), {"bytes": output.stat().st_size})
+    return results
+
+
+def bench_generate(base, scale, repeat):
+    # End to end for a Keil and an IAR project: a full generation, then an up-to-date run served by the cache.
+    results = {}
+    for name, writer in (("keil", write_uvprojx), ("iar", write_ewp)):
+        path = base / f"generate-{name}" / f"demo.{'uvprojx' if name == 'keil' else 'ewp'}"
+        path.parent.mkdir()
+        writer(path, scale["groups"], scale["files"], 4)
+        cache = path.parent / ".keil2json"
+
+        def full():
+            CompileCommandsGenerator(path=path.parent, config_manager=ConfigManager()).generate()
+        seconds, _ = measure(full, repeat, lambda: (shutil.rmtree(cache, ignore_errors=True),
+                                                    ProjectDocument._cache.clear()))
+        files = scale["groups"] * scale["files"]
+        results[f"generate_{name}"] = (seconds, files, {})
+        seconds, _ = measure(full, repeat)
+        results[f"generate_{name}_cached"] = (seconds, files, {})
+    return results
+
+
+BENCHMARKS = {
+    "discovery": bench_discovery,
+    "xml": bench_xml,
+    "entries": bench_entries,
+    "tokenize": bench_tokenize,
+    "make": bench_make,
+    "write": bench_write,
+    "generate": bench_generate,
+}
+
+
+def git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    except OSError:
+        return ""
+    return result.stdout.strip() if result.returncode == 0 else ""
+
+
+def compare(old, new):
+    print(f"\n{'scale':7s} {'benchmark':24s} {'old ms':>10s} {'new ms':>10s} {'ratio':>7s}")
+    for scale, benchmarks in new["results"].items():
+        for name, result in benchmarks.items():
+            previous = old.get("results", {}).get(scale, {}).get(name)
+            if not previous:
+                continue
+            ratio = result["seconds"] / previous["seconds"] if previous["seconds"] else 0.0
+            print(f"{scale:7s} {name:24s} {previous['seconds'] * 1000:10.1f} {result['seconds'] * 1000:10.1f} "
+                  f"{ratio:6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Keil2Json benchmark suite on synthetic projects")
+    parser.add_argument("--scales", nargs="+", choices=sorted(SCALES), default=["small", "medium"])
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="Run only these benchmarks")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the best one is kept")
+    parser.add_argument("--output", default=str(RESULTS_DIR / "benchmark-results.json"), help="JSON results file")
+    parser.add_argument("--compare", metavar="FILE", help="Print the change against an earlier results file")
+    args = parser.parse_args()
+
+    base = Path(tempfile.mkdtemp(prefix="keil2json-suite-"))
+    saved_env = {key: os.environ.get(key) for key in ("HOME", "APPDATA")}
+    os.environ.update(write_config(base / "home"))
+    results = {}
+    try:
+        for scale_name in args.scales:
+            scale = SCALES[scale_name]
+            results[scale_name] = {}
+            for name, bench in BENCHMARKS.items():
+                if args.only and name not in args.only:
+                    continue
+                workdir = base / scale_name / name
+                workdir.mkdir(parents=True)
+                outcome = bench(workdir, scale, args.repeat)
+                if isinstance(outcome, tuple):
+                    outcome = {name: outcome}
+                for label, (seconds, items, extra) in outcome.items():
+                    results[scale_name][label] = dict(
+                        {"seconds": round(seconds, 6), "items": items,
+                         "items_per_second": round(items / seconds, 1) if seconds else 0.0}, **extra)
+                    print(f"{scale_name:7s} {label:24s} {seconds * 1000:10.1f} ms  {items:9d} items  "
+                          f"{items / seconds if seconds else 0:12.0f} /s", flush=True)
+                shutil.rmtree(workdir, ignore_errors=True)
+    finally:
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        shutil.rmtree(base, ignore_errors=True)
+
+    data = {
+        "version": RESULTS_VERSION,
+        "tool_version": Keil2Json.TOOL_VERSION,
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "repeat": args.repeat,
+        "scales": {name: SCALES[name] for name in args.scales},
+        "results": results,
+    }
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    Path(args.output).write_text(json.dumps(data, indent=4), encoding="utf-8")
+    print(f"results written: {Path(args.output).resolve()}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), data)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Synthetic inputs shared by the benchmark scripts: project files, make output, directory trees and a
+# Makefile project driven by the fake make in benchmarks/fake_make.
+
+import os
+import random
+from pathlib import Path
+
+FAKE_MAKE_DIR = Path(__file__).resolve().parent / "fake_make"
+FAKE_MAKE_LOG_ENV = "KEIL2JSON_FAKE_MAKE_LOG"
+
+
+def write_uvprojx(path, groups, files, targets):
+    with path.open("w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8" standalone="no" ?>\n<Project>\n<Targets>\n')
+        for t in range(targets):
+            f.write(f"<Target><TargetName>Target {t}</TargetName><uAC6>{t % 2}</uAC6>\n")
+            f.write("<TargetOption><TargetArmAds><Cads><VariousControls>")
+            f.write(f"<Define>USE_HAL_DRIVER,TARGET_{t}</Define>")
+            f.write("<IncludePath>" + ";".join(f".\\inc\\m{i}" for i in range(40)) + "</IncludePath>")
+            f.write("</VariousControls></Cads></TargetArmAds></TargetOption>\n<Groups>\n")
+            for g in range(groups):
+                f.write(f"<Group><GroupName>G{g}</GroupName><Files>\n")
+                for n in range(files):
+                    f.write(f"<File><FileName>f{n}.c</FileName><FileType>1</FileType>"
+                            f"<FilePath>.\\src\\g{g}\\f{n}.c</FilePath></File>\n")
+                f.write("</Files></Group>\n")
+            f.write("</Groups></Target>\n")
+        f.write("</Targets>\n</Project>\n")
+
+
+def write_ewp(path, groups, files, targets):
+    with path.open("w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<project>\n')
+        for t in range(targets):
+            f.write(f"<configuration><name>Cfg{t}</name><settings><name>ICCARM</name><data>\n")
+            for o in range(60):
+                f.write(f"<option><name>Opt{o}</name><state>{o}</state></option>\n")
+            f.write(f"<option><name>CCDefines</name><state>CFG_{t}</state><state>USE_HAL</state></option>\n")
+            f.write("<option><name>CCIncludePath2</name>"
+                    + "".join(f"<state>$PROJ_DIR$\\inc\\m{i}</state>" for i in range(40))
+                    + "</option>\n</data></settings></configuration>\n")
+        for g in range(groups):
+            f.write(f"<group><name>G{g}</name>\n<file><name>$PROJ_DIR$\\src\\g{g}\\first.c</name></file>\n")
+            f.write(f"<group><name>Sub{g}</name><file><name>$PROJ_DIR$\\src\\g{g}\\sub.c</name></file></group>\n")
+            for n in range(files):
+                f.write(f"<file><name>$PROJ_DIR$\\src\\g{g}\\f{n}.c</name>"
+                        f"<configuration><name>Cfg0</name><settings><name>ICCARM</name><data>"
+                        f"<option><name>CCDefines</name><state>FILE_{n}</state></option>"
+                        f"</data></settings></configuration></file>\n")
+            f.write("</group>\n")
+        f.write("</project>\n")
+
+
+def synthetic_log(count, seed=0):
+    # Roughly what make -n prints for an embedded tree: compiles are the minority, the rest is
+    # echo/mkdir/link/objcopy noise and directory changes.
+    rng = random.Random(seed)
+    includes = " ".join(f"-IDrivers/Module{i}/Inc" for i in range(30))
+    defines = '-DUSE_HAL_DRIVER -DSTM32F407xx -DVERSION=\\"1.2.3\\" -D\'BOARD_NAME="disco"\''
+    lines = []
+    for n in range(count):
+        roll = rng.random()
+        if roll < 0.3:
+            lines.append(f"arm-none-eabi-gcc -c -mcpu=cortex-m4 -mthumb {defines} {includes} -O2 -g "
+                         f"-MMD -MP -MF\"build/f{n}.d\" Src/f{n}.c -o build/f{n}.o")
+        elif roll < 0.4:
+            lines.append(f"\"/opt/gcc arm/bin/arm-none-eabi-gcc\" -c -x assembler-with-cpp {includes} "
+                         f"Startup/s{n}.s -o build/s{n}.o")
+        elif roll < 0.6:
+            lines.append(f"echo \"CC Src/f{n}.c\"")
+        elif roll < 0.7:
+            lines.append("mkdir -p build/Src build/Drivers")
+        elif roll < 0.8:
+            lines.append(f"make[{n % 3 + 1}]: Entering directory '/work/fw/lib{n % 7}'")
+        elif roll < 0.9:
+            lines.append(f"arm-none-eabi-gcc build/f{n}.o -mcpu=cortex-m4 -Wl,--gc-sections -o build/app.elf")
+        else:
+            lines.append("arm-none-eabi-objcopy -O ihex build/app.elf build/app.hex")
+    return lines
+
+
+def build_tree(root, file_count, fanout=20, files_per_dir=50):
+    # A firmware repository: VCS, tooling and build output dirs (pruned by the walker) and vendor SDK and
+    # driver sources (walked) hold the files. The project sits one level below the deepest of them, so the
+    # walk lists every directory that is not pruned before it finds the project.
+    heavy = [".git/objects", "node_modules/pkg", "Objects", "build/out", "SDK/vendor", "Drivers/lib", "Middlewares/src"]
+    created = 0
+    index = 0
+    while created < file_count:
+        bucket = heavy[index % len(heavy)]
+        sub = root / bucket / f"d{index // fanout}" / f"e{index % fanout}"
+        sub.mkdir(parents=True, exist_ok=True)
+        for n in range(min(files_per_dir, file_count - created)):
+            (sub / f"f{n}.c").touch()
+        created += files_per_dir
+        index += 1
+    project_dir = root / "firmware" / "app" / "boards" / "rev_b" / "MDK-ARM"
+    project_dir.mkdir(parents=True, exist_ok=True)
+    (project_dir / "app.uvprojx").write_text("<Project/>", encoding="utf-8")
+    return project_dir / "app.uvprojx"
+
+
+def write_make_project(root, lines, seed=0):
+    # A Makefile project whose make -n output is the synthetic log; returns the environment that puts the
+    # fake make first on PATH and points it at the log.
+    root.mkdir(parents=True, exist_ok=True)
+    (root / "Makefile").write_text("all:\n\t@echo synthetic\nclean:\n", encoding="utf-8")
+    log = root / "make-n.log"
+    log.write_text("\n".join(synthetic_log(lines, seed)) + "\n", encoding="utf-8")
+    return {
+        "PATH": str(FAKE_MAKE_DIR) + os.pathsep + os.environ.get("PATH", ""),
+        FAKE_MAKE_LOG_ENV: str(log),
+    }
+
+
+def write_config(home):
+    # An empty tool config under a private HOME/APPDATA, so runs never see the user's toolchains or
+    # stop in the setup wizard.
+    config = home / ".config" / "KeilFormat" if os.name != "nt" else home / "KeilFormat"
+    config.mkdir(parents=True, exist_ok=True)
+    (config / "config.json").write_text('{"version": 1}', encoding="utf-8")
+    return {"HOME": str(home), "APPDATA": str(home)}